@@ -10,9 +10,9 @@ Version: 1 (24-May-2023)
 import logging
 import os
 import progress.spinner as spinner
-import threading
-import time
+import sys
 
+from concurrent.futures import ThreadPoolExecutor, wait
 from RuleParser import RuleParser           # KPM
 from RuleOutput import RuleOutput           # KPM
 from utils import get_folders, ElapsedTime  # KPM
@@ -21,16 +21,17 @@ from utils import get_folders, ElapsedTime  # KPM
 
 log = logging.getLogger(__name__)
 
+# --------------------------------------------------------------------------
+# Set of top-level rule folders to ignore
+SKIP_FOLDERS = frozenset({'National Biodiversity Network Trust', 
+                          'Personal', 
+                          'SystemRules'})
+
 # ------------------------------------------------------------------------------
 # Class which orchestrates the data input, parsing and output processes.
 
 class RuleController:
 
-    # List of top-level rule folders to ignore
-    SKIP_FOLDERS = ['National Biodiversity Network Trust', 
-                    'Personal', 
-                    'SystemRules'] 
-
     # --------------------------------------------------------------------------
     # Constructor.
 
@@ -65,22 +66,27 @@ class RuleController:
         for ix, folder in enumerate(folders):
             log.info('-'*50)
             log.info(f'Processing folder {ix+1} of {len(folders)}')
-            f = os.path.split(folder)[1]
-            if f in self.SKIP_FOLDERS:
-                log.info(f'Skipping folder: {f}')            
+            name = os.path.basename(folder)
+            if name in SKIP_FOLDERS:
+                log.info(f'Skipping folder: {name}')            
             else:
                 if self.parser.read_rules(folder) == False:
                     ok = False
                     log.warning('*** Error occurred while processing files')
+        self.parser.close()
 
         # Output results on new thread to allow spinner to work
-        thread = threading.Thread(target=self.output.write)
-        thread.start()
-        with spinner.Spinner('Writing results...') as spin:
-            while thread.is_alive():
-                spin.next()
-                time.sleep(0.1)
-        thread.join()            
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.output.write)
+            with spinner.Spinner('Writing results...') as spin:
+                while not future.done():
+                    # Block on the future rather than sleeping so that the 
+                    # loop exits as soon as writing finishes
+                    wait([future], timeout=0.25)
+                    if sys.stderr.isatty():
+                        spin.next()
+            # Re-raise any exception from the writer thread
+            future.result()
         
         log.info('='*50)
         et.log_elapsed_time()
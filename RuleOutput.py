@@ -10,15 +10,58 @@ import csv
 import logging
 import os
 
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from itertools import count
+from operator import attrgetter, itemgetter
+from RuleParser import ADDITIONAL_FIELDS, DIFFICULTY_FIELDS      # KPM
+from RuleParser import PERIOD_FIELDS, POLYGON_FIELDS            # KPM
+from RuleParser import SPECIES_FIELDS, STAGE_PERIOD_FIELDS      # KPM
+
 # ------------------------------------------------------------------------------
 
 log = logging.getLogger(__name__)
 
+# --------------------------------------------------------------------------
+# Column indices for consolidated ruleset rows
+CON_COL_INFO = 5            # information
+CON_COL_DIFF = 6            # difficulty_key
+CON_COL_START = 7           # start_date
+CON_COL_END = 8             # end_date
+CON_COL_STAGE = 9           # stage
+CON_COL_GB = 10             # 10km_GB
+CON_COL_IRELAND = 11        # 10km_Ireland
+CON_COL_CI = 12             # 10km_CI
+CON_COL_QUERY = 13          # query
+
 # ------------------------------------------------------------------------------
 # Class which orchestrates the output of processed rule data.
 
 class RuleOutput:
 
+    BUFFER_SIZE = 1024 * 1024   # output file buffer size (bytes)
+    MAX_WORKERS = 4             # no. of threads used to write files
+
+    # Output files for each parser list: file name, parser attribute, columns.
+    # The columns are those of the parser lists; see RuleParser *_FIELDS
+    FILES = (
+        ('additionals.csv', 'additionals', ADDITIONAL_FIELDS),
+        ('difficulties.csv', 'difficulties', DIFFICULTY_FIELDS),
+        ('flightperiods.csv', 'flights', STAGE_PERIOD_FIELDS),
+        ('periods.csv', 'periods', PERIOD_FIELDS),
+        ('ranges.csv', 'ranges', POLYGON_FIELDS),
+        ('regions.csv', 'regions', POLYGON_FIELDS),
+        ('seasonals.csv', 'seasonals', STAGE_PERIOD_FIELDS),
+        ('species_nbn.csv', 'species', SPECIES_FIELDS)
+    )
+    # As above, with getters for the parser columns precomputed
+    SCHEMAS = tuple((fn_txt, attrgetter(attr), fields, itemgetter(*fields))
+                    for fn_txt, attr, fields in FILES)
+    # Columns of the consolidated ruleset file (see CON_COL_* indices)
+    CONSOL_FIELDS = ('id', 'taxon_key', 'ruleset', 'organisation', 'message', 
+                     'information', 'difficulty_key', 'start_date', 'end_date', 
+                     'stage', '10km_GB', '10km_Ireland', '10km_CI', 'query')
+                     # 'stage', '10km_GB', '10km_Ireland', '10km_CI', 'query') #RE
+
     # --------------------------------------------------------------------------
     # Constructor.
 
@@ -30,93 +73,94 @@ class RuleOutput:
         '''
         self.folder_output = os.path.abspath(folder_output)
         self.parser = parser
-        self.consol = []    # single, consolidated ruleset list
+        # Create the output folder now rather than failing after parsing
+        os.makedirs(self.folder_output, exist_ok=True)
 
     # --------------------------------------------------------------------------
     # Create and initialise a new consol rule.
 
-    def create_consol_record(self, taxon_key, ruleset, rule):
+    def create_consol_record(self, record_id, taxon_key, ruleset, org, msg):
         '''
-        Params: taxon_key (string) - 
+        Params: record_id (int) - 
+                taxon_key (string) - 
                 ruleset (string) -
-                rule (dict) -
-        Return: (dict)
+                org (string) -
+                msg (string) -
+        Return: (list) - row with values in all_rules.csv column order
         '''        
-        record = {
-            'id': len(self.consol) + 1,
-            'taxon_key': taxon_key.upper(),
-            'ruleset': ruleset,
-            'organisation': rule['organisation'],
-            'message': rule['message'],
-            'information': '',
-            'difficulty_key': '',
-            'start_date': '',
-            'end_date': '',
-            'stage': '',
-            '10km_GB': '',
-            '10km_Ireland': '',
-            '10km_CI': ''
-        }
-        self.consol.append(record)
+        record = [record_id, taxon_key.upper(), ruleset, org, msg,
+                  '', '', '', '', '', '', '', '', '']
 
         return record
 
     # --------------------------------------------------------------------------
-    # Populate the consol dict.
+    # Generate the consolidated ruleset rows. Rows are yielded one at a time so
+    # that they can be written without holding the whole ruleset in memory.
 
-    def populate_consol(self):
+    def generate_consol(self):
+        '''
+        Params: N/A
+        Return: (generator) - yields rows in all_rules.csv column order
+        '''
         log.info('Creating consolidated ruleset...')
-        self.consol.clear()
+        ids = count(1)
+        # Parser columns are zipped into rules; see RuleParser *_FIELDS
         # additionals
-        for rule in self.parser.additionals:
-            record = self.create_consol_record(rule['taxon_key'], 'additional', rule)
-            record['information'] = rule['information']
+        for tvk, org, msg, info in zip(*self.parser.additionals.values()):
+            record = self.create_consol_record(next(ids), tvk, 'additional', org, msg)
+            record[CON_COL_INFO] = info
+            yield record
         # difficulties
-        for rule in self.parser.difficulties:
-            record = self.create_consol_record(rule['taxon_key'], 'difficulty', rule)
-            record['difficulty_key'] = rule['difficulty_key']
-            # record['query'] = f'difficulty_key >= {rule["difficulty_key"]}' # RE
+        for tvk, org, msg, diff in zip(*self.parser.difficulties.values()):
+            record = self.create_consol_record(next(ids), tvk, 'difficulty', org, msg)
+            record[CON_COL_DIFF] = diff
+            # record[CON_COL_QUERY] = f'difficulty_key >= {diff}' # RE
+            yield record
         # flightperiods
-        for rule in self.parser.flights:
-            record = self.create_consol_record(rule['taxon_key'], 'flightperiod', rule)
-            record['start_date'] = rule['start_date']            
-            record['end_date'] = rule['end_date']            
-            record['stage'] = rule['stage']            
-            # record['query'] = f'stage.as_upper == "{{stage.upper()}}" and (start_date > "{rule["start_date"]}" or end_date < "{rule["end_date"]}")' # RE
+        for tvk, org, msg, start, end, stage in zip(*self.parser.flights.values()):
+            record = self.create_consol_record(next(ids), tvk, 'flightperiod', org, msg)
+            record[CON_COL_START] = start            
+            record[CON_COL_END] = end            
+            record[CON_COL_STAGE] = stage            
+            # record[CON_COL_QUERY] = f'stage.as_upper == "{{stage.upper()}}" and (start_date > "{start}" or end_date < "{end}")' # RE
+            yield record
         # periods
-        for rule in self.parser.periods:
-            record = self.create_consol_record(rule['taxon_key'], 'period', rule)
-            record['start_date'] = rule['start_date']            
-            record['end_date'] = rule['end_date']
-            # if len(rule['end_date']) > 0:   # RE
-            #     record['query'] = f'{rule["start_date"]} > "{{date}}" or {rule["end_date"]} < "{{date}}"'
+        for tvk, org, msg, start, end in zip(*self.parser.periods.values()):
+            record = self.create_consol_record(next(ids), tvk, 'period', org, msg)
+            record[CON_COL_START] = start            
+            record[CON_COL_END] = end
+            # if len(end) > 0:   # RE
+            #     record[CON_COL_QUERY] = f'{start} > "{{date}}" or {end} < "{{date}}"'
             # else:
-            #      record['query'] = f'{rule["start_date"]} > "{{date}}"'
+            #      record[CON_COL_QUERY] = f'{start} > "{{date}}"'
+            yield record
         # ranges
-        for rule in self.parser.ranges:
-            record = self.create_consol_record(rule['taxon_key'], 'range', rule)
-            record['10km_GB'] = rule['10km_GB']            
-            record['10km_Ireland'] = rule['10km_Ireland']            
-            record['10km_CI'] = rule['10km_CI'] 
-            # record['query'] = f'{rule["10km_GB"].upper()} =~ ".*{{gridref}}" or {rule["10km_Ireland"].upper()} =~ ".*{{gridref}}" or {rule["10km_CI"].upper()} =~ ".*{{gridref}}"' # RE
+        for tvk, org, msg, gb, ir, ci in zip(*self.parser.ranges.values()):
+            record = self.create_consol_record(next(ids), tvk, 'range', org, msg)
+            record[CON_COL_GB] = gb            
+            record[CON_COL_IRELAND] = ir            
+            record[CON_COL_CI] = ci 
+            # record[CON_COL_QUERY] = f'{gb.upper()} =~ ".*{{gridref}}" or {ir.upper()} =~ ".*{{gridref}}" or {ci.upper()} =~ ".*{{gridref}}"' # RE
+            yield record
         # regions
-        for rule in self.parser.regions:
-            record = self.create_consol_record(rule['taxon_key'], 'region', rule)
-            record['10km_GB'] = rule['10km_GB']            
-            record['10km_Ireland'] = rule['10km_Ireland']            
-            record['10km_CI'] = rule['10km_CI'] 
-            # record['query'] = f'{rule["10km_GB"].upper()} =~ ".*{{gridref}}" or {rule["10km_Ireland"].upper()} =~ ".*{{gridref}}" or {rule["10km_CI"].upper()} =~ ".*{{gridref}}"' # RE
+        for tvk, org, msg, gb, ir, ci in zip(*self.parser.regions.values()):
+            record = self.create_consol_record(next(ids), tvk, 'region', org, msg)
+            record[CON_COL_GB] = gb            
+            record[CON_COL_IRELAND] = ir            
+            record[CON_COL_CI] = ci 
+            # record[CON_COL_QUERY] = f'{gb.upper()} =~ ".*{{gridref}}" or {ir.upper()} =~ ".*{{gridref}}" or {ci.upper()} =~ ".*{{gridref}}"' # RE
+            yield record
         # seasonals
-        for rule in self.parser.seasonals:
-            record = self.create_consol_record(rule['taxon_key'], 'seasonal', rule)
-            record['start_date'] = rule['start_date']            
-            record['end_date'] = rule['end_date']            
-            record['stage'] = rule['stage'] 
-            # if len(rule['stage']) == 0:  # RE
-            #     record['query'] = f'{rule["start_date"]} > "{{date}}" or {rule["end_date"]} < "{{date}}"'
+        for tvk, org, msg, start, end, stage in zip(*self.parser.seasonals.values()):
+            record = self.create_consol_record(next(ids), tvk, 'seasonal', org, msg)
+            record[CON_COL_START] = start            
+            record[CON_COL_END] = end            
+            record[CON_COL_STAGE] = stage 
+            # if len(stage) == 0:  # RE
+            #     record[CON_COL_QUERY] = f'{start} > "{{date}}" or {end} < "{{date}}"'
             # else:
-            #     record['query'] = f'[term for term in $split({rule["stage"].lower()},",") if term == "{{stage.lower()}}"].length > 0) and ({rule["start_date"]} > "{{date}}" or {rule["end_date"]} < "{{date}}")'
-
+            #     record[CON_COL_QUERY] = f'[term for term in $split({stage.lower()},",") if term == "{{stage.lower()}}"].length > 0) and ({start} > "{{date}}" or {end} < "{{date}}")'
+            yield record
 
     # --------------------------------------------------------------------------
     # Write results to output channels.
@@ -127,61 +171,45 @@ class RuleOutput:
         Return: N/A
         '''
         log.info('-'*50)
-        self.populate_consol()
         log.info(f'Writing files to folder: {self.folder_output}')
-        self.write_file('additionals.csv', self.parser.additionals,
-            ['taxon_key', 'organisation', 'message', 'information'])
-
-        self.write_file('difficulties.csv', self.parser.difficulties,
-            ['taxon_key', 'organisation', 'message', 'difficulty_key'])
-                
-        self.write_file('flightperiods.csv', self.parser.flights,
-            ['taxon_key', 'organisation', 'message', 'start_date', 'end_date',
-             'stage'])
-
-        self.write_file('periods.csv', self.parser.periods,
-            ['taxon_key', 'organisation', 'message', 'start_date', 'end_date'])
-        
-        self.write_file('ranges.csv', self.parser.ranges,
-            ['taxon_key', 'organisation', 'message', '10km_GB', '10km_Ireland', 
-             '10km_CI'])
-        
-        self.write_file('regions.csv', self.parser.regions,
-            ['taxon_key', 'organisation', 'message', '10km_GB', '10km_Ireland', 
-             '10km_CI'])
-        
-        self.write_file('seasonals.csv', self.parser.seasonals,
-            ['taxon_key', 'organisation', 'message', 'start_date', 'end_date', 
-             'stage'])
-
-        self.write_file('species_nbn.csv', self.parser.species,
-            ['taxon_key', 'preferred_tvk', 'name', 'authority', 'group', 
-             'name_type', 'well_formed', 'msg_id'])
-
-        self.write_file('all_rules.csv', self.consol,
-            ['id', 'taxon_key', 'ruleset', 'organisation', 'message', 
-             'information', 'difficulty_key', 'start_date', 'end_date', 
-             'stage', '10km_GB', '10km_Ireland', '10km_CI', 'query'])
-             # 'stage', '10km_GB', '10km_Ireland', '10km_CI', 'query']) #RE
+        # Files are independent, so write them concurrently. Calling result()
+        # re-raises any exception from the worker thread.
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            # Parser rules are held as columns, so zip them into rows
+            futures = [executor.submit(self.write_file, fn_txt,
+                                       zip(*getter(get_data(self.parser))), 
+                                       fields)
+                       for fn_txt, get_data, fields, getter in self.SCHEMAS]
+            # Consolidated rows are generated in column order as they are 
+            # written
+            futures.append(executor.submit(self.write_file, 'all_rules.csv', 
+                self.generate_consol(), self.CONSOL_FIELDS))
+            for future in as_completed(futures):
+                future.result()
         
     # ----------------------------------------------------------------------
     # Write a single CSV file
 
-    def write_file(self, fn_txt, data, fields):
+    def write_file(self, fn_txt, rows, fields):
         '''
         Params: fn_txt (string) - name of file to write
-                data (list) - data to be written
+                rows (iterable) - rows of values in the same order as fields
                 fields (list) - column headers
         Return: N/A
         '''        
         fn = os.path.join(self.folder_output, fn_txt)
         log.debug(f'Writing file: {fn}')
-        with open(fn, 'w', encoding='utf-8') as out_file:
-            writer = csv.DictWriter(out_file, lineterminator='\r',
-                                    quoting=csv.QUOTE_NONNUMERIC,
-                                    fieldnames=fields)
-            writer.writeheader()
-            writer.writerows(data)   
+        # No explicit flush/fsync: the buffer is drained once when the file is
+        # closed, which matters on network or slow file systems
+        # All strings are quoted: minimal quoting only quotes fields containing
+        # the line terminator ('\r'), so messages spanning several lines ('\n')
+        # would be written bare and split into rows when read
+        with open(fn, 'w', encoding='utf-8', newline='',
+                  buffering=self.BUFFER_SIZE) as out_file:
+            writer = csv.writer(out_file, lineterminator='\r',
+                                quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(fields)
+            writer.writerows(rows)
 
 # ------------------------------------------------------------------------------
 # Test
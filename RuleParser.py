@@ -7,27 +7,430 @@ Verion : 2 (15-Jun-2023)
 
 # ------------------------------------------------------------------------------
 
+import csv
 import logging
 import os
+import sys
 
-from configparser import ConfigParser
-from glob import glob
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 from progress.bar import Bar
-from utils import get_files, get_folders, MultiOrderedDict      # KPM
+from utils import get_files, get_files_recursive, get_folders  # KPM
+from utils import read_bytes, FastConfigParser                  # KPM
 
 # ------------------------------------------------------------------------------
 
 log = logging.getLogger(__name__)
 skip_log = logging.getLogger('skip')
 skip_log.propagate = False
-skip_log.addHandler(logging.FileHandler('./logs/skip.log', mode='w'))
 
+# --------------------------------------------------------------------------
+ERROR = '<ERROR>'  # Error flag
+# Columns of each list of rules. Rules are held column-wise, as a dict of lists
+# keyed by column name, rather than as a list of dicts. See create_columns()
+ADDITIONAL_FIELDS = ('taxon_key', 'organisation', 'message', 'information')
+DIFFICULTY_FIELDS = ('taxon_key', 'organisation', 'message', 'difficulty_key')
+PERIOD_FIELDS = ('taxon_key', 'organisation', 'message', 'start_date', 
+                 'end_date')
+STAGE_PERIOD_FIELDS = PERIOD_FIELDS + ('stage',)
+POLYGON_FIELDS = ('taxon_key', 'organisation', 'message', '10km_GB', 
+                  '10km_Ireland', '10km_CI')
+SPECIES_FIELDS = ('taxon_key', 'preferred_tvk', 'name', 'authority', 'group', 
+                  'name_type', 'well_formed', 'msg_id')
+# Sections processed in each type of rule file. Any others are skipped
+INI_SECTIONS = frozenset({'EndMetadata', 'Metadata', 'INI', 'Data'})
+PERIOD_SECTIONS = frozenset({'EndMetadata', 'Metadata', 'Data'})
+POLYGON_SECTIONS = frozenset({'EndMetadata', 'Metadata', '10km_GB', 
+                              '10km_Ireland', '10km_CI'})
+# Rule file parsers, keyed by allow_duplicates. See get_configparser()
+CONFIGPARSERS = {
+    False: FastConfigParser(delimiters=('=', ','), allow_no_value=True),
+    True: FastConfigParser(allow_duplicates=True)
+}
+
+# ------------------------------------------------------------------------------
+# Functions
+# ------------------------------------------------------------------------------
+# The parse_* functions each parse a single rule file, given its path and its
+# contents (or None to read the file). They are not RuleParser methods so that
+# they can be run in worker processes. Each returns a tuple:
+#   rules (dict) - columns of rules read from the file
+#   errors (list) - error messages to be logged
+#   skipped (list) - names of sections which are not processed
+#   abort (bool) - True if no further files in the folder are to be processed
+
+# --------------------------------------------------------------------------
+# Append a single rule to a dict of columns. Values are in column order, one
+# for each column.
+
+def add_rule(rules, *values):
+    '''
+    Params: rules (dict) - columns to which to add rule
+            values - value of each column
+    Return: N/A
+    '''
+    assert len(values) == len(rules), 'One value is required for each column'
+    for column, value in zip(rules.values(), values):
+        column.append(value)
+
+# --------------------------------------------------------------------------
+# Append several rules to a dict of columns, one column at a time. Each value 
+# is an iterable of the values for that column, all of the same length.
+
+def add_rules(rules, *values):
+    '''
+    Params: rules (dict) - columns to which to add rules
+            values - iterable of values for each column
+    Return: N/A
+    '''
+    assert len(values) == len(rules), 'One iterable is required for each column'
+    for column, column_values in zip(rules.values(), values):
+        column.extend(column_values)
+    assert len(set(map(len, rules.values()))) == 1, 'Columns differ in length'
+
+# --------------------------------------------------------------------------
+# Return an empty dict of columns.
+
+def create_columns(fields):
+    '''
+    Params: fields (tuple) - column names
+    Return: (dict) - empty list for each column
+    '''
+    return {field: [] for field in fields}
+
+# --------------------------------------------------------------------------
+# Returns an empty, configured FastConfigParser object. Varies to account for 
+# the vagueries of the NBN rule file structures. Option names are lowercased.
+# One object of each kind is created per process and cleared before each file
+# rather than creating a new one per file.
+
+def get_configparser(allow_duplicates=False):
+    '''
+    Params: allow_duplicates (bool) - allow duplicate keys if True
+    Return: (FastConfigParser) - object used to read rule files
+    '''
+    rv = CONFIGPARSERS[allow_duplicates]
+    rv.clear()
+    return rv
+
+# --------------------------------------------------------------------------
+# Return the [INI] value referred to by each [Data] value. [INI] keys are 
+# lowercased when read, so references are lowercased to match, as ConfigParser 
+# does. Missing references, and [Data] keys without a value, give ERROR.
+
+def get_ini_values(i_data, d_data):
+    '''
+    Params: i_data (dict) - options of [INI] section
+            d_data (dict) - options of [Data] section
+    Return: (list) - [INI] value for each [Data] option
+    '''
+    ini_get = i_data.get
+    return [ini_get(v.lower(), ERROR) if v is not None else ERROR 
+            for v in d_data.values()]
+
+# --------------------------------------------------------------------------
+# Return the sections of a ruleset which will not be processed.
+
+def get_skipped_sections(config, sections):
+    '''
+    Params: config (FastConfigParser) - object containing ruleset
+            sections (frozenset) - sections which will be processed
+    Return: (list) - names of sections which will not be processed
+    '''
+    # Most files have no skipped sections, which a set comparison checks 
+    # without a loop. Otherwise keep file order for the skip log
+    if config.keys() <= sections:
+        return []
+    return [s for s in config if s not in sections]
+
+# --------------------------------------------------------------------------
+# Returns a FastConfigParser object containing a single rule file.
+
+def read_config(f, data, allow_duplicates=False):
+    '''
+    Params: f (string) - path to rule file
+            data (bytes) - contents of file, or None to read the file
+            allow_duplicates (bool) - allow duplicate keys if True
+    Return: (FastConfigParser) - object containing ruleset
+    '''
+    config = get_configparser(allow_duplicates)
+    if data is None:
+        config.read(f)
+    else:
+        config.read_data(data, f)
+
+    return config
+
+# --------------------------------------------------------------------------
+# Parse a single 'additional' rule file.
+
+def parse_additional(f, data, org):
+    '''
+    Params: f (string) - path to rule file
+            data (bytes) - contents of file, or None to read the file
+            org (string) - name of organisation
+    Return: (tuple) - rules, errors, skipped, abort
+    '''
+    rules = create_columns(ADDITIONAL_FIELDS)
+    errors = []
+    config = read_config(f, data)
+    skipped = get_skipped_sections(config, INI_SECTIONS)
+    error_msg = ERROR
+    # [Metadata]
+    m_data = config.get('Metadata')
+    if m_data is not None:
+        tt = m_data.get('testtype', ERROR)
+        if tt != 'AncillarySpecies':
+            errors.append(f'Unknown TestType in file "{f}"')
+        error_msg = m_data.get('errormsg', ERROR)
+        if error_msg == ERROR:
+            errors.append(f'No ErrorMsg in additional file "{f}"')
+    else:
+        errors.append(f'File "{f}" does not contain [Metadata]')
+    # [INI]
+    i_data = config.get('INI')
+    if i_data is not None:
+        # [Data]
+        d_data = config.get('Data')
+        if d_data is not None:
+            n = len(d_data)
+            add_rules(rules, d_data.keys(), repeat(org, n), 
+                      repeat(error_msg, n), get_ini_values(i_data, d_data))
+        else:
+            errors.append(f'File "{f}" does not contain [Data]')
+
+    else:
+        errors.append(f'File "{f}" does not contain [INI]')
+
+    return rules, errors, skipped, False
+
+# --------------------------------------------------------------------------
+# Parse a single 'difficulty' rule file.
+
+def parse_difficulty(f, data, org):
+    '''
+    Params: f (string) - path to rule file
+            data (bytes) - contents of file, or None to read the file
+            org (string) - name of organisation
+    Return: (tuple) - rules, errors, skipped, abort
+    '''
+    rules = create_columns(DIFFICULTY_FIELDS)
+    errors = []
+    config = read_config(f, data)
+    skipped = get_skipped_sections(config, INI_SECTIONS)
+    # [Metadata]
+    m_data = config.get('Metadata')
+    if m_data is not None:
+        tt = m_data.get('testtype', '')
+        if tt != 'IdentificationDifficulty':
+            errors.append(f'Unknown TestType in file "{f}"')
+    else:
+        errors.append(f'File "{f}" does not contain [MetaData]')
+    # [INI]
+    i_data = config.get('INI')
+    if i_data is not None:
+        # [Data]
+        d_data = config.get('Data')
+        if d_data is not None:
+            add_rules(rules, d_data.keys(), repeat(org, len(d_data)), 
+                      get_ini_values(i_data, d_data), d_data.values())
+        else:
+            errors.append(f'File "{f}" does not contain [Data]')
+    else:
+        errors.append(f'File "{f}" does not contain [INI]')
+
+    return rules, errors, skipped, False
+
+# --------------------------------------------------------------------------
+# Parse a single 'flightperiod' rule file.
+
+def parse_flightperiod(f, data, org):
+    '''
+    Params: f (string) - path to rule file
+            data (bytes) - contents of file, or None to read the file
+            org (string) - name of organisation
+    Return: (tuple) - rules, errors, skipped, abort
+    '''
+    rules = create_columns(STAGE_PERIOD_FIELDS)
+    errors = []
+    config = read_config(f, data, allow_duplicates=True)
+    skipped = get_skipped_sections(config, PERIOD_SECTIONS)
+    # [Metadata]
+    m_data = config.get('Metadata')
+    if m_data is not None:
+        tt = m_data.get('testtype', ERROR)
+        if tt != 'PeriodWithinYear':
+            errors.append(f'Unknown TestType in file "{f}"')
+        tvk = m_data.get('tvk', ERROR)
+        error_msg = m_data.get('errormsg', ERROR)
+        start_date = m_data.get('startdate', ERROR)
+        end_date = m_data.get('enddate', ERROR)
+        if (error_msg == ERROR or tvk == ERROR or 
+            start_date == ERROR or end_date == ERROR):
+            errors.append(f'Incorrectly formatted file (1): "{f}"')
+    
+        add_rule(rules, tvk, org, error_msg, start_date, end_date, '')
+        # [Data]
+        d_data = config.get('Data')
+        if d_data:
+            # Additional stage-specific start/end dates
+            stage = (d_data.get('stage', ERROR).
+                     replace('\n\n', '\n').splitlines())
+            s_d = (d_data.get('startdate', ERROR).
+                   replace('\n\n', '\n').splitlines())
+            e_d = (d_data.get('enddate', ERROR).
+                   replace('\n\n', '\n').splitlines())
+            if ERROR in stage or ERROR in s_d or ERROR in e_d:
+                errors.append(f'Incorrectly formatted file (2): "{f}"')
+                return rules, errors, skipped, True
+            
+            for i in range(len(stage)):
+                add_rule(rules, tvk, org, error_msg, s_d[i], e_d[i], stage[i])
+    else:
+        errors.append(f'File "{f}" does not contain [Metadata]')
+
+    return rules, errors, skipped, False
+
+# --------------------------------------------------------------------------
+# Parse a single generic period rule file.
+
+def parse_period_generic(f, data, org, test_type):
+    '''
+    Params: f (string) - path to rule file
+            data (bytes) - contents of file, or None to read the file
+            org (string) - organisation name
+            test_type (string) - name of test type
+    Return: (tuple) - rules, errors, skipped, abort
+    '''
+    # Add additional column for specific test type
+    has_stage = test_type == 'PeriodWithinYear'
+    if has_stage:
+        rules = create_columns(STAGE_PERIOD_FIELDS)
+    else:
+        rules = create_columns(PERIOD_FIELDS)
+    errors = []
+    config = read_config(f, data, allow_duplicates=True)
+    skipped = get_skipped_sections(config, PERIOD_SECTIONS)
+    # [Metadata]
+    m_data = config.get('Metadata')
+    if m_data is not None:
+        tt = m_data.get('testtype', ERROR)
+        if tt.lower() != test_type.lower():
+            errors.append(f'Unknown TestType in file: "{f}"')
+            return rules, errors, skipped, True
+
+        tvk = m_data.get('tvk', ERROR)
+        error_msg = m_data.get('errormsg', ERROR)
+        start_date = m_data.get('startdate', ERROR)
+        end_date = m_data.get('enddate', ERROR)
+        if (error_msg == ERROR or tvk == ERROR or 
+            start_date == ERROR or end_date == ERROR):
+            errors.append(f'Incorrectly formatted file (1): "{f}"')
+            return rules, errors, skipped, True
+        
+        # The stage of the [Metadata] dates is empty
+        if has_stage:
+            add_rule(rules, tvk, org, error_msg, start_date, end_date, '')
+        else:
+            add_rule(rules, tvk, org, error_msg, start_date, end_date)
+        # [Data]
+        d_data = config.get('Data')
+        if d_data:
+            # Additional stage-specific start/end dates
+            stage = (d_data.get('stage', ERROR).
+                     replace('\n\n', '\n').splitlines())
+            s_d = (d_data.get('startdate', ERROR).
+                   replace('\n\n', '\n').splitlines())
+            e_d = (d_data.get('enddate', ERROR).
+                   replace('\n\n', '\n').splitlines())
+            if ERROR in stage or ERROR in s_d or ERROR in e_d:
+                errors.append(f'Incorrectly formatted file (2): "{f}"')
+                return rules, errors, skipped, True
+            
+            for i in range(len(stage)):
+                if has_stage:
+                    add_rule(rules, tvk, org, error_msg, s_d[i], e_d[i], 
+                             stage[i])
+                else:
+                    add_rule(rules, tvk, org, error_msg, s_d[i], e_d[i])
+                
+    else:
+        errors.append(f'File "{f}" does not contain [MetaData]')
+
+    return rules, errors, skipped, False
+
+# --------------------------------------------------------------------------
+# Parse a single generic polygon rule file.
+
+def parse_polygon_generic(f, data, org):
+    '''
+    Params: f (string) - path to rule file
+            data (bytes) - contents of file, or None to read the file
+            org (string) - name of organisation
+    Return: (tuple) - rules, errors, skipped, abort
+    '''
+    # --------------------------------------------
+    def process_country(config, country_section):
+        gr = ''
+        # Each gridref is a key, and each is followed by ';'
+        gridrefs = config.get(country_section)
+        if gridrefs:
+            gr = ';'.join(gridrefs) + ';'
+
+        return gr            
+
+    #---------------------------------------------
+    errors = []
+    config = read_config(f, data)
+    skipped = get_skipped_sections(config, POLYGON_SECTIONS)
+    tvk = ERROR
+    error_msg = ERROR
+    # [Metadata]
+    m_data = config.get('Metadata')
+    if m_data is not None:
+        tt = m_data.get('testtype', ERROR)
+        if tt != 'WithoutPolygon':
+            errors.append(f'Unknown TestType in file "{f}"')
+        tvk = m_data.get('datarecordid', ERROR)
+        error_msg = m_data.get('errormsg', ERROR)
+        if tvk == ERROR or error_msg == ERROR:
+            errors.append(f'Incorrectly formatted file "{f}"')
+    else:
+        errors.append(f'File "{f}" does not contain [Metadata]')
+    
+    gb = process_country(config, '10km_GB')
+    ir = process_country(config, '10km_Ireland')
+    ci = process_country(config, '10km_CI')
+    rules = create_columns(POLYGON_FIELDS)
+    add_rule(rules, tvk, org, error_msg, gb, ir, ci)
+
+    return rules, errors, skipped, False
+
+# ------------------------------------------------------------------------------
+# Classes
 # ------------------------------------------------------------------------------
 # Class which orchestrates the data input, parsing and output processes.
 
 class RuleParser:
 
-    ERROR = '<ERROR>'  # Error flag
+    BUFFER_SIZE = 1024 * 1024   # species file buffer size (bytes)
+    CHUNK_SIZE = 64             # no. of files sent to a worker process at once
+    PARALLEL_MIN_FILES = 256    # min. no. of files to parse in worker processes
+    READ_AHEAD = 32             # max. no. of files read ahead of parsing
+    READ_WORKERS = 8            # no. of threads used to read ahead
+    # Columns whose values are repeated across many rules. Each distinct value
+    # is stored once by interning it. 
+    INTERN_FIELDS = frozenset({'taxon_key', 'organisation', 'message'})
+    # Name of method used to process each type of rule folder
+    RULE_FOLDERS = {
+        'additional': 'process_additional',
+        'flightperiod': 'process_flightperiod',
+        'period': 'process_period',
+        'range': 'process_range',
+        'seasonalperiod': 'process_seasonalperiod',
+        'tenkm': 'process_tenkm'
+    }
 
     # --------------------------------------------------------------------------
     # Constructor.
@@ -37,55 +440,106 @@ class RuleParser:
         Params: N/A
         Return: N/A
         '''
-        # Initialise lists used to contain processed rules
-        self.additionals = []
-        self.difficulties = []
-        self.flights = []
-        self.periods = []
-        self.ranges = []
-        self.regions = []
-        self.seasonals = []
-        self.species = []
+        # Initialise columns used to contain processed rules
+        self.additionals = create_columns(ADDITIONAL_FIELDS)
+        self.difficulties = create_columns(DIFFICULTY_FIELDS)
+        self.flights = create_columns(STAGE_PERIOD_FIELDS)
+        self.periods = create_columns(PERIOD_FIELDS)
+        self.ranges = create_columns(POLYGON_FIELDS)
+        self.regions = create_columns(POLYGON_FIELDS)
+        self.seasonals = create_columns(STAGE_PERIOD_FIELDS)
+        self.species = create_columns(SPECIES_FIELDS)
 
         self.skips = 0
+        self.executor = None    # created when first needed
+        # The skip log is created (and truncated) here rather than on import,
+        # as worker processes also import this module. Under the spawn start
+        # method they do so before they can tell that they are workers
+        if not skip_log.handlers:
+            skip_log.addHandler(logging.FileHandler('./logs/skip.log', 
+                                                    mode='w'))
 
     # --------------------------------------------------------------------------
-    # Check whether any sections will not not processed for a given ruleset.
+    # Shut down the worker processes, if any.
 
-    def check_sections(this, config, file, sections):
+    def close(self):
         '''
-        Params: config (ConfigParser) - object containing ruleset
-                file (string) - path to file containing rule
-                sections (list) - list of sections which will be processed
+        Params: N/A
         Return: N/A
         '''
-        skip_sections = []
-        for s in config.sections():
-            if s not in sections:
-                this.skips += 1
-                skip_sections.append(s)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    # --------------------------------------------------------------------------
+    # Read the contents of a list of files, in order. Files are read on worker
+    # threads, up to READ_AHEAD files ahead of the caller, so that reading 
+    # overlaps with parsing.
 
-        if len(skip_sections) > 0:
-            skipped = '; '.join(skip_sections)
-            skip_log.info(f'[{skipped}] - {file}')
+    def read_ahead(self, files):
+        '''
+        Params: files (list) - paths to files
+        Return: (generator) - yields contents of each file (see read_bytes)
+        '''
+        with ThreadPoolExecutor(max_workers=self.READ_WORKERS) as executor:
+            futures = deque(executor.submit(read_bytes, f) 
+                            for f in files[:self.READ_AHEAD])
+            for f in files[self.READ_AHEAD:]:
+                yield futures.popleft().result()
+                futures.append(executor.submit(read_bytes, f))
+            while futures:
+                yield futures.popleft().result()
 
     # --------------------------------------------------------------------------
-    # Returns a configured ConfigParser object. Varies to account for the 
-    # vagueries of the NBN rule file structures.
+    # Parse a list of rule files and add the results to a list of rules. Large
+    # folders are parsed in worker processes; results are handled in file order
+    # so that logs and rules are as if parsed sequentially.
 
-    def get_configparser(self, allow_duplicates=False):
+    def parse_files(self, title, files, parse_file, rules, *args):
         '''
-        Params: allow_duplicates (bool) - allow duplicate keys if True
-        Return: (ConfigParser) - object used to read rule files
+        Params: title (string) - text shown on progress bar
+                files (list) - paths to rule files
+                parse_file (function) - one of the parse_* functions
+                rules (dict) - columns to which to add rules
+                args - further arguments passed to parse_file after the data
+        Return: (bool) - returns True if no errors encountered
         '''
-        if allow_duplicates:
-            rv = ConfigParser(strict=False, dict_type=MultiOrderedDict)
+        rv = True
+        args = [repeat(arg) for arg in args]
+        if len(files) >= self.PARALLEL_MIN_FILES:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor()
+            # Each worker reads its own files
+            results = self.executor.map(parse_file, files, repeat(None), 
+                                        *args, chunksize=self.CHUNK_SIZE)
         else:
-            rv = ConfigParser(strict=False, allow_no_value=True, 
-                              delimiters=('=', ','))
+            results = map(parse_file, files, self.read_ahead(files), *args)
+
+        # Redraw the progress bar at most once per 1% of files
+        step = max(1, len(files) // 100)
+        with Bar(title, max=len(files)) as bar:
+            rows = enumerate(zip(files, results), start=1)
+            for i, (f, (rules_file, errors, skipped, abort)) in rows:
+                if i % step == 0:
+                    bar.goto(i)
+                if len(skipped) > 0:
+                    self.skips += len(skipped)
+                    skip_log.info(f'[{"; ".join(skipped)}] - {f}')
+                for error in errors:
+                    log.error(error)
+                    rv = False
+                for field, column in rules_file.items():
+                    if field in self.INTERN_FIELDS:
+                        # Values may be None if a key has no value
+                        column = [sys.intern(v) if isinstance(v, str) else v 
+                                  for v in column]
+                    rules[field].extend(column)
+                if abort:
+                    return False
+            bar.goto(len(files))
 
         return rv
-    
+
     # --------------------------------------------------------------------------
     # Process 'additional' rules within a single folder.
 
@@ -95,55 +549,13 @@ class RuleParser:
                 folder (string) - path to folder containing rules
         Return: (bool) - returns True if no errors encountered 
         '''
-        rv = True
         files = get_files(folder)
         if len(files) == 0:
             log.warning(f'No files found in folder "{folder}"')
             return False
         
-        with Bar('Processing additional rules...', max=len(files)) as bar:
-            for f in files:
-                bar.next()
-                config = self.get_configparser()
-                config.read(f)
-                sections = ['EndMetadata', 'Metadata', 'INI', 'Data']
-                self.check_sections(config, f, sections)
-                # [Metadata]
-                if config.has_section('Metadata'):
-                    m_data = config['Metadata']
-                    tt = m_data.get('TestType', self.ERROR)
-                    if tt != 'AncillarySpecies':
-                        log.error(f'Unknown TestType in file "{f}"')
-                        rv = False
-                    error_msg = m_data.get('ErrorMsg', self.ERROR)
-                    if error_msg == self.ERROR:
-                        log.error(f'No ErrorMsg in additional file "{f}"')
-                        rv = False
-                else:
-                    log.error(f'File "{f}" does not contain [Metadata]')
-                    rv = False
-                # [INI]
-                if config.has_section('INI'):
-                    i_data = config['INI']
-                    # [Data]
-                    if config.has_section('Data'):
-                        for k, v in config.items('Data'):
-                            additional = {
-                                    'taxon_key': k,
-                                    'organisation': org,
-                                    'message': error_msg,
-                                    'information': i_data.get(v, self.ERROR)}
-                            self.additionals.append(additional)
-                    else:
-                        log.error(f'File "{f}" does not contain [Data]')
-                        rv = False
-
-                else:
-                    log.error(f'File "{f}" does not contain [INI]')
-                    rv = False
-                
-                del config
-
+        rv = self.parse_files('Processing additional rules...', files, 
+                              parse_additional, self.additionals, org)
         return rv
     
     # --------------------------------------------------------------------------
@@ -155,52 +567,16 @@ class RuleParser:
                 folder (string) - path to folder containing rules
         Return: (bool) - returns True if no errors encountered 
         '''
-        rv = True
         files = get_files(folder)
         if len(files) == 0:
             # Check for nested folders in exceptional cases
-            files = glob(folder+'/**/*.*', recursive=True) 
+            files = get_files_recursive(folder)
             if len(files) == 0:
                 log.warning(f'No files found in folder "{folder}"')
                 return False
 
-        with Bar('Processing difficulty rules...', max=len(files)) as bar:
-            for f in files:
-                bar.next()
-                config = self.get_configparser()
-                config.read(f)
-                sections = ['EndMetadata', 'Metadata', 'INI', 'Data']
-                self.check_sections(config, f, sections)
-                # [Metadata]
-                if config.has_section('Metadata'):
-                    m_data = config['Metadata']
-                    tt = m_data.get('TestType', '')
-                    if tt != 'IdentificationDifficulty':
-                        log.error(f'Unknown TestType in file "{f}"')
-                        rv = False
-                else:
-                    log.error(f'File "{f}" does not contain [MetaData]')
-                    rv = False
-                # [INI]
-                if config.has_section('INI'):
-                    i_data = config['INI']
-                    # [Data]
-                    if config.has_section('Data'):
-                        for k, v in config.items('Data'):
-                            diff = {'taxon_key': k,
-                                    'organisation': org,
-                                    'message': i_data.get(v, self.ERROR),
-                                    'difficulty_key': v}
-                            self.difficulties.append(diff)
-                    else:
-                        log.error(f'File "{f}" does not contain [Data]')
-                        rv = False
-                else:
-                    log.error(f'File "{f}" does not contain [INI]')
-                    rv = False
-                
-                del config
-
+        rv = self.parse_files('Processing difficulty rules...', files, 
+                              parse_difficulty, self.difficulties, org)
         return rv
     
     # --------------------------------------------------------------------------
@@ -212,72 +588,13 @@ class RuleParser:
                 folder (string) - path to folder containing rules
         Return: (bool) - returns True if no errors encountered
         '''
-        rv = True
         files = get_files(folder)
         if len(files) == 0:
             log.warning(f'No files found in folder "{folder}"')
             return False
         
-        with Bar('Processing flightperiod rules...', max=len(files)) as bar:
-            for f in files:
-                bar.next()
-                config = self.get_configparser(allow_duplicates=True)
-                config.read(f)
-                sections = ['EndMetadata', 'Metadata', 'Data']
-                self.check_sections(config, f, sections)
-                # [Metadata]
-                if config.has_section('Metadata'):
-                    m_data = config['Metadata']
-                    tt = m_data.get('TestType', self.ERROR)
-                    if tt != 'PeriodWithinYear':
-                        log.error(f'Unknown TestType in file "{f}"')
-                        rv = False
-                    tvk = m_data.get('Tvk', self.ERROR)
-                    error_msg = m_data.get('ErrorMsg', self.ERROR)
-                    start_date = m_data.get('StartDate', self.ERROR)
-                    end_date = m_data.get('EndDate', self.ERROR)
-                    if (error_msg == self.ERROR or tvk == self.ERROR or 
-                        start_date == self.ERROR or end_date == self.ERROR):
-                        log.error(f'Incorrectly formatted file (1): "{f}"')
-                        rv = False
-                
-                    flight = {'taxon_key': tvk,
-                              'organisation': org,
-                              'message': error_msg,
-                              'start_date': start_date,
-                              'end_date': end_date,
-                              'stage': ''}
-                    self.flights.append(flight)                
-                    # [Data]
-                    if (config.has_section('Data') and 
-                        len(config.items('Data')) > 0):
-                        # Additional stage-specific start/end dates
-                        d_data = config['Data']
-                        stage = (d_data.get('Stage', self.ERROR).
-                                 replace('\n\n', '\n').splitlines())
-                        s_d = (d_data.get('StartDate', self.ERROR).
-                               replace('\n\n', '\n').splitlines())
-                        e_d = (d_data.get('EndDate', self.ERROR).
-                               replace('\n\n', '\n').splitlines())
-                        if (self.ERROR in stage or self.ERROR in s_d or 
-                            self.ERROR in e_d):
-                            log.error(f'Incorrectly formatted file (2): "{f}"')
-                            return False
-                        
-                        for i in range(len(stage)):
-                            flight = {'taxon_key': tvk,
-                                      'organisation': org,
-                                      'message': error_msg,
-                                      'start_date': s_d[i],
-                                      'end_date': e_d[i],
-                                      'stage': stage[i]}
-                            self.flights.append(flight)                  
-                else:
-                    log.error(f'File "{f}" does not contain [Metadata]')
-                    rv = False
-
-                del config
-
+        rv = self.parse_files('Processing flightperiod rules...', files, 
+                              parse_flightperiod, self.flights, org)
         return rv
 
     # --------------------------------------------------------------------------
@@ -300,82 +617,16 @@ class RuleParser:
         Params: org (string) - organisation name
                 folder (string) - path to folder containing rules
                 test_type (string) - name of test type
-                rules (list) - list to which to add rules
+                rules (dict) - columns to which to add rules
         Return: (bool) - returns True if no errors encountered
         '''
-        rv = True
         files = get_files(folder)
         if len(files) == 0:
             log.warning(f'No files found in folder "{folder}"')
             return False
         
-        with Bar('Processing period rules...', max=len(files)) as bar:
-            for f in files:
-                bar.next()
-                config = self.get_configparser(allow_duplicates=True)
-                config.read(f)            
-                sections = ['EndMetadata', 'Metadata', 'Data']
-                self.check_sections(config, f, sections)
-                # [Metadata]
-                if config.has_section('Metadata'):
-                    m_data = config['Metadata']
-                    tt = m_data.get('TestType', self.ERROR)
-                    if tt.lower() != test_type.lower():
-                        log.error(f'Unknown TestType in file: "{f}"')
-                        return False
-
-                    error_msg = m_data.get('ErrorMsg', self.ERROR)
-                    tvk = m_data.get('Tvk', self.ERROR)
-                    error_msg = m_data.get('ErrorMsg', self.ERROR)
-                    start_date = m_data.get('StartDate', self.ERROR)
-                    end_date = m_data.get('EndDate', self.ERROR)
-                    if (error_msg == self.ERROR or tvk == self.ERROR or 
-                        start_date == self.ERROR or end_date == self.ERROR):
-                        log.error(f'Incorrectly formatted file (1): "{f}"')
-                        return False
-                    
-                    period = {'taxon_key': tvk,
-                              'organisation': org,
-                              'message': error_msg,
-                              'start_date': start_date,
-                              'end_date': end_date}
-                    
-                    # Add additional key for specific test type
-                    if test_type == 'PeriodWithinYear':
-                        period['stage'] = ''
-
-                    rules.append(period)                    
-                    # [Data]
-                    if (config.has_section('Data') and 
-                        len(config.items('Data')) > 0):
-                        # Additional stage-specific start/end dates
-                        d_data = config['Data']
-                        stage = (d_data.get('Stage', self.ERROR).
-                                 replace('\n\n', '\n').splitlines())
-                        s_d = (d_data.get('StartDate', self.ERROR).
-                               replace('\n\n', '\n').splitlines())
-                        e_d = (d_data.get('EndDate', self.ERROR).
-                               replace('\n\n', '\n').splitlines())
-                        if (self.ERROR in stage or self.ERROR in s_d or 
-                            self.ERROR in e_d):
-                            log.error(f'Incorrectly formatted file (2): "{f}"')
-                            return False
-                        
-                        for i in range(len(stage)):
-                            period = {'taxon_key': tvk,
-                                      'organisation': org,
-                                      'message': error_msg,
-                                      'start_date': s_d[i],
-                                      'end_date': e_d[i],
-                                      'stage': stage[i]}
-                            rules.append(period)                            
-                            
-                else:
-                    log.error(f'File "{f}" does not contain [MetaData]')
-                    rv = False
-                
-                del config
-
+        rv = self.parse_files('Processing period rules...', files, 
+                              parse_period_generic, rules, org, test_type)
         return rv
     
     # --------------------------------------------------------------------------
@@ -385,62 +636,16 @@ class RuleParser:
         '''
         Params: org (string) - name of organisation
                 folder (string) - path to folder containing rules
-                rules (list) - list to which results are written
-        Return: (string) - gridrefs 
+                rules (dict) - columns to which results are written
+        Return: (bool) - returns True if no errors encountered
         '''
-        # --------------------------------------------
-        def process_country(config, country_section):
-            gr = ''
-            if config.has_section(country_section):
-                for k, v in config.items(country_section):
-                    gr = gr + k + ';'
-
-            return gr            
-
-        #---------------------------------------------
-        rv = True
         files = get_files(folder)
         if len(files) == 0:
             log.warning(f'No files found in folder "{folder}"')
             return False
         
-        with Bar('Processing region rules...', max=len(files)) as bar:
-            for f in files:
-                bar.next()
-                config = self.get_configparser()
-                config.read(f)
-                sections = ['EndMetadata', 'Metadata', '10km_GB', 
-                            '10km_Ireland', '10km_CI']
-                self.check_sections(config, f, sections)
-                # [Metadata]
-                if config.has_section('Metadata'):
-                    m_data = config['Metadata']
-                    tt = m_data.get('TestType', self.ERROR)
-                    if tt != 'WithoutPolygon':
-                        log.error(f'Unknown TestType in file "{f}"')
-                        rv = False
-                    tvk = m_data.get('DataRecordId', self.ERROR)
-                    error_msg = m_data.get('ErrorMsg', self.ERROR)
-                    if tvk == self.ERROR or error_msg == self.ERROR:
-                        log.error(f'Incorrectly formatted file "{f}"')
-                        rv = False
-                else:
-                    log.error(f'File "{f}" does not contain [Metadata]')
-                    rv = False
-                
-                gb = process_country(config, '10km_GB')
-                ir = process_country(config, '10km_Ireland')
-                ci = process_country(config, '10km_CI')
-                region = {'taxon_key': tvk,
-                          'organisation': org,
-                          'message': error_msg,
-                          '10km_GB': gb,
-                          '10km_Ireland': ir,
-                          '10km_CI': ci}                 
-                rules.append(region)
-                                
-                del config
-
+        rv = self.parse_files('Processing region rules...', files, 
+                              parse_polygon_generic, rules, org)
         return rv
     
     # --------------------------------------------------------------------------
@@ -518,18 +723,9 @@ class RuleParser:
                         # Handle all other folder structures
                         for rule in rules:
                             r = os.path.split(rule)[1].lower()
-                            if r == 'additional':
-                                rv = self.process_additional(org, rule)
-                            elif r == 'flightperiod':
-                                rv = self.process_flightperiod(org, rule)
-                            elif r == 'period':
-                                rv = self.process_period(org, rule)
-                            elif r == 'range':
-                                rv = self.process_range(org, rule)
-                            elif r == 'seasonalperiod':
-                                rv = self.process_seasonalperiod(org, rule)
-                            elif r == 'tenkm':
-                                rv = self.process_tenkm(org, rule)
+                            method = self.RULE_FOLDERS.get(r)
+                            if method is not None:
+                                rv = getattr(self, method)(org, rule)
                             else:
                                 log.error(f'Unknown rule folder type: {rule}')
                                 rv = False
@@ -550,31 +746,24 @@ class RuleParser:
             log.error(f'Species list file does not exist: {file_path}')
             return False
         
-        with open(file_path) as file:
-            species = file.readlines()
-
-        header = True
-        for line in species:
-            if line[0] == "'":
-                continue
-            if header:
-                header = False
-                continue
-            fields = line.strip('\n').split('#')
-            if len(fields) == 8:
-                spec = {'taxon_key': fields[0],
-                        'preferred_tvk': fields[1],
-                        'name': fields[2],
-                        'authority': fields[3],
-                        'group': fields[4],
-                        'name_type': fields[5],
-                        'well_formed': fields[6],
-                        'msg_id': fields[7]
-                        }
-                self.species.append(spec)
-            else:
-                log.warning(f'Malformed line "{line}" in file "{file_path}"')
-                rv = False
+        # Stream the file rather than reading all lines into memory. Quotes 
+        # have no special meaning in the species list
+        with open(file_path, newline='', buffering=self.BUFFER_SIZE) as file:
+            reader = csv.reader(file, delimiter='#', quoting=csv.QUOTE_NONE)
+            header = True
+            for fields in reader:
+                if len(fields) > 0 and fields[0].startswith("'"):
+                    continue
+                if header:
+                    header = False
+                    continue
+                if len(fields) == 8:
+                    add_rule(self.species, *fields)
+                else:
+                    line = '#'.join(fields)
+                    log.warning(f'Malformed line "{line}" in file '
+                                f'"{file_path}"')
+                    rv = False
 
         return rv
 
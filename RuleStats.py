@@ -10,10 +10,15 @@ Version: 1 (14-Jun-2023)
 
 import csv
 import logging
+import numpy as np
+import os
 import pandas as pd
-import progress.spinner as spinner
-import threading
-import time
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:
+    pa = None   # fall back to the pandas CSV reader and writer
 
 # ------------------------------------------------------------------------------
 # Write results to both screen and file 'stats.log'.
@@ -39,7 +44,78 @@ SPEC_COL_TVK_PREF = 16      # preferred taxon key
 # Column indices for all_rules file
 RUL_COL_TVK = 1             # taxon key
 RUL_COL_RULESET = 2         # ruleset
-ROL_COL_ORG = 3             # org
+# Rulesets counted for each species, in output column order
+RULESETS = ('additional', 'difficulty', 'flightperiod', 'period', 'range', 
+            'region', 'seasonal')
+
+# ------------------------------------------------------------------------------
+# Functions
+# ------------------------------------------------------------------------------
+# Count the rules of each ruleset for each taxon key, in the order in which
+# each pair first appears.
+
+def count_rules(rules):
+    '''
+    Params: rules (DataFrame) - rules with taxon_key and ruleset columns
+    Return: (Series) - no. of rules indexed by taxon_key and ruleset
+    '''
+    taxon_key = rules['taxon_key'].str.upper()
+    return rules.groupby([taxon_key, 'ruleset'], sort=False, 
+                         observed=True).size()
+
+# ------------------------------------------------------------------------------
+# Return the names f0, f1... for each column of a CSV file, as counted in its
+# header row.
+
+def get_column_names(fn):
+    '''
+    Params: fn (string) - path to CSV file
+    Return: (list) - column names
+    '''
+    with open(fn, 'r', encoding='utf-8-sig', newline='') as file:
+        header = next(csv.reader(file), [])
+    return [f'f{ix}' for ix in range(len(header))]
+
+# ------------------------------------------------------------------------------
+# Read columns of a CSV file, selected by index, into a DataFrame. The header
+# row is skipped, but every column is named (see get_column_names) so that a 
+# file with no rows other than the header is read as an empty DataFrame. Uses 
+# pyarrow's multithreaded reader if it is installed, else the pandas C engine.
+# If chunksize is given, the file is read with the pandas C engine as an 
+# iterator of DataFrames of at most chunksize rows.
+
+def read_csv(fn, columns, categories=(), chunksize=None):
+    '''
+    Params: fn (string) - path to CSV file
+            columns (dict) - column names keyed by column index
+            categories (tuple) - names of columns to read as categoricals
+            chunksize (int) - no. of rows to read at a time, or None
+    Return: (DataFrame) or (iterator) if chunksize is given
+    '''
+    names = {f'f{ix}': name for ix, name in columns.items()}
+    if pa is None or chunksize is not None:
+        dtype = {f: 'category' if name in categories else str 
+                 for f, name in names.items()}
+        reader = pd.read_csv(fn, encoding='utf-8-sig', engine='c', 
+                             header=None, skiprows=1, 
+                             names=get_column_names(fn), na_filter=False, 
+                             dtype=dtype, usecols=list(names), 
+                             chunksize=chunksize)
+        if chunksize is None:
+            return reader.rename(columns=names)
+        return (df.rename(columns=names) for df in reader)
+
+    column_types = {f: pa.dictionary(pa.int32(), pa.string()) 
+                    if name in categories else pa.string()
+                    for f, name in names.items()}
+    table = pacsv.read_csv(fn, 
+        read_options=pacsv.ReadOptions(skip_rows=1, 
+                                       column_names=get_column_names(fn)),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(include_columns=list(names),
+                                             column_types=column_types,
+                                             strings_can_be_null=False))
+    return table.to_pandas().rename(columns=names)
 
 # ------------------------------------------------------------------------------
 # Classes
@@ -52,21 +128,26 @@ class RuleStats:
     # Constructor.
 
     def __init__(self, fn_species=DEFAULT_FN_SPECIES, fn_rules=DEFAULT_FN_RULES,
-                    fn_output=DEFAULT_FN_OUTPUT):
+                    fn_output=DEFAULT_FN_OUTPUT, chunksize=None):
         '''
         Params: fn_species (string) - species filename
                 fn_rules (string) - rules filename
                 fn_output (string) - output results file
+                chunksize (int) - no. of rules to read at a time, or None to
+                                  read the whole rules file at once
         Return: N/A
         '''
         self.fn_species = fn_species
         self.fn_rules = fn_rules
         self.fn_output = fn_output
-        self.rules = {}         # dict of rules read from CSV
-        self.species = {}       # dict of species read from CSV
+        self.chunksize = chunksize
+        self.rules = None       # Series of rule counts by taxon and ruleset
+        self.species = None     # DataFrame of species read from CSV
+        self.stats = None       # DataFrame of stats per species
         
     # --------------------------------------------------------------------------
-    # Analyse the data to produce the stats
+    # Analyse the data to produce the stats. Rule counts are accumulated by 
+    # integer species and ruleset codes rather than one increment per rule.
 
     def analyse(self):
         '''
@@ -74,70 +155,82 @@ class RuleStats:
         Return: N/A
         '''
         log.info('Analysing species list...')
+        rules = self.rules
+        species = self.species
+        n_species = len(species)
+        # Taxon keys are mapped to integer codes once: their positions in the
+        # (unique) species index, or -1 if not in the species list. Each 
+        # distinct key is looked up once and the codes for the rule counts 
+        # are taken via the codes of their index.
+        taxa, rulesets = rules.index.levels
+        taxa_code = species.index.get_indexer(taxa)
+        code = taxa_code[rules.index.codes[0]]
+        known = code >= 0
+        # Likewise rulesets are mapped to their position in RULESETS
+        ruleset_code = pd.Index(RULESETS).get_indexer(rulesets)[
+            rules.index.codes[1]]
+        valid = ruleset_code >= 0
+        # Report unknown rulesets in species order, once per rule
+        unknown = known & ~valid
+        for (taxon, ruleset), n_unknown in rules[unknown].iloc[
+                code[unknown].argsort(kind='stable')].items():
+            for _ in range(n_unknown):
+                log.error(f'Unknown ruleset "{ruleset}" for taxon key {taxon}')
+
         # Calculate rule totals for each species
-        for taxon in self.species:
-            if taxon in self.rules:
-                spec = self.species[taxon]
-                spec['rules_total'] += len(self.rules[taxon])
-                spec['rules_own'] += len(self.rules[taxon])
-                # count types of rule
-                for rule in self.rules[taxon]:
-                    if rule[0] not in spec:
-                        log.error(f'Unknown ruleset "{rule[0]}" for '
-                                  f'taxon key {taxon}')
-                        continue
-                    spec[rule[0]] += 1
- 
+        n = rules.to_numpy()
+        rules_own = np.zeros(n_species, dtype=np.int64)
+        np.add.at(rules_own, code[known], n[known])
+        # Matrix of counts by species and ruleset. Column-major, as it is 
+        # output column by column.
+        counts = np.zeros((n_species, len(RULESETS)), dtype=np.int64, 
+                          order='F')
+        ok = known & valid
+        np.add.at(counts, (code[ok], ruleset_code[ok]), n[ok])
+
         # Add preferred taxon counts to totals
-        for taxon in self.species:
-            spec = self.species[taxon]
-            if spec['taxon_key_preferred'] != taxon:
-                if spec['taxon_key_preferred'] not in self.species:
-                    log.error(f'Unknown taxon_key_preferred '
-                       f'({spec["taxon_key_preferred"]}) for taxon key {taxon}')
-                    continue
-                
-                spec_pref = self.species[spec['taxon_key_preferred']]
-                spec_pref['rules_total'] += spec['rules_own']
-                spec_pref['rules_preferred'] += spec['rules_own']
-
-        # Initialise totals
-        n_pref = 0          # no. of preferred taxons with rules
-        n_nonpref = 0       # no. of non-preferred taxons with rules
-        n_rules = 0         # total no. of rules
-        n_orphan_rule = 0   # no. of rules without a matching species 
+        pref = species['taxon_key_preferred']
+        pref_code = species.index.get_indexer(pref)
+        missing = pref_code < 0
+        for taxon, taxon_pref in pref[missing].items():
+            log.error(f'Unknown taxon_key_preferred '
+                      f'({taxon_pref}) for taxon key {taxon}')
+        nonpref = ~missing & (pref_code != np.arange(n_species))
+        rules_preferred = np.zeros(n_species, dtype=np.int64)
+        np.add.at(rules_preferred, pref_code[nonpref], rules_own[nonpref])
+
+        # Output frame is built column by column in output order
+        self.stats = pd.DataFrame({
+            'taxon_key_preferred': pref,
+            'rank': species['rank'],
+            'rules_total': rules_own + rules_preferred,
+            'rules_own': rules_own,
+            'rules_preferred': rules_preferred,
+            **dict(zip(RULESETS, counts.T))
+        }, index=species.index)
+
+        # Calculate totals
+        # Taxa in the order in which they first appear in the rules file
+        order = pd.unique(rules.index.codes[0])
+        taxa_code = taxa_code[order]
+        orphan = taxa_code < 0
+        for taxon_key in taxa[order[orphan]]:
+            log.info(f'Orphaned rule for taxon key {taxon_key}')
+        n_orphan_rule = int(orphan.sum())   # no. of taxa without a species
+        # Calculate no. of rules which apply to preferred taxons
+        taxa_code = taxa_code[~orphan]
+        n_pref = int((pref_code[taxa_code] == taxa_code).sum())
+        n_nonpref = len(taxa_code) - n_pref
+        n_rules = rules.sum()
         # count of rule types
-        n_types = {
-            'additional': 0,
-            'difficulty': 0,
-            'flightperiod': 0,
-            'period': 0,
-            'range': 0,
-            'region': 0,
-            'seasonal': 0
-        }
-        # Calculate totals      
-        for taxon_key in self.rules:
-            for rule in self.rules[taxon_key]:
-                n_rules += 1
-                n_types[rule[0]] += 1
-            
-            if taxon_key not in self.species:
-                log.info(f'Orphaned rule for taxon key {taxon_key}')
-                n_orphan_rule += 1
-                continue
-            # Calculate no. of rules which apply to preferred taxons
-            spec = self.species[taxon_key]
-            if spec['taxon_key_preferred'] == taxon_key:
-                n_pref += 1
-            else:
-                n_nonpref += 1
+        n_types = dict(zip(RULESETS, np.bincount(ruleset_code[valid], 
+            weights=n[valid], minlength=len(RULESETS)).astype(np.int64)))
         
         # Output summary stats
         log.info('-'*50)
-        log.info(f'No. of taxons in species file         : {len(self.species):,}')
+        log.info(f'No. of taxons in species file         : {len(species):,}')
         log.info(f'No. of rules                          : {n_rules:,}')
-        log.info(f'No. of taxons with rules              : {len(self.rules):,}')
+        log.info(f'No. of taxons with rules              : {len(order):,}')
         log.info(f'No. of orphaned rules without taxons  : {n_orphan_rule:,}')
         log.info(f'No. of preferred taxons with rules    : {n_nonpref:,}')
         log.info(f'No. of non-preferred taxons with rules: {n_pref:,}')
@@ -159,61 +252,48 @@ class RuleStats:
         '''
         self.read_files()
         self.analyse()
-        # Output results on new thread to allow spinner to work
-        thread = threading.Thread(target=self.write_file)
-        thread.start()
-        with spinner.Spinner('Writing results...') as spin:
-            while thread.is_alive():
-                spin.next()
-                time.sleep(0.1)
-        thread.join()            
+        self.write_file()
     
     # --------------------------------------------------------------------------
-    # Read CSV files and populate rules and species dicts.
+    # Read CSV files into rules and species DataFrames.
 
     def read_files(self):
         '''
         Params: N/A
         Return: N/A
         '''
-        self.rules.clear()
-        self.species.clear()
         log.info(f'Reading rules file: {self.fn_rules}')
-
-        with open(self.fn_rules, 'r', encoding='utf-8-sig') as file:
-            reader = csv.reader(file)
-            next(reader)
-            for row in reader:
-                taxon_key = row[RUL_COL_TVK].upper()
-                ruleset = row[RUL_COL_RULESET]
-                org = row[ROL_COL_ORG]
-                self.rules.setdefault(taxon_key, []).append([ruleset, org])
+        # Rulesets repeat, so are held as categoricals
+        rules = read_csv(self.fn_rules, 
+            {RUL_COL_TVK: 'taxon_key', RUL_COL_RULESET: 'ruleset'}, 
+            categories=('ruleset',), chunksize=self.chunksize)
+        # Only the no. of rules of each ruleset for each taxon is needed, so 
+        # the rules are counted rather than kept. When reading in chunks, the
+        # counts of each chunk are combined.
+        if self.chunksize is None:
+            self.rules = count_rules(rules)
+        else:
+            self.rules = (pd.concat([count_rules(chunk) for chunk in rules])
+                          .groupby(level=[0, 1], sort=False, observed=True)
+                          .sum())
 
         log.info(f'Reading species file: {self.fn_species}')
-        with open(self.fn_species, 'r', encoding='utf-8-sig') as file:
-            reader = csv.reader(file)
-            next(reader)
-            for row in reader:
-                taxon_key = row[SPEC_COL_TVK].upper()
-                rank = row[SPEC_COL_RANK]
-                taxon_key_preferred = row[SPEC_COL_TVK_PREF].upper()
-                self.species[taxon_key] = {
-                    'taxon_key_preferred': taxon_key_preferred,
-                    'rank': rank,
-                    'rules_total': 0,
-                    'rules_own': 0,
-                    'rules_preferred': 0,
-                    'additional': 0,
-                    'difficulty': 0,
-                    'flightperiod': 0,
-                    'period': 0,
-                    'range': 0,
-                    'region': 0,
-                    'seasonal': 0
-                }
+        species = read_csv(self.fn_species, 
+            {SPEC_COL_TVK: 'taxon_key', SPEC_COL_RANK: 'rank', 
+             SPEC_COL_TVK_PREF: 'taxon_key_preferred'}, categories=('rank',))
+        species['taxon_key'] = species['taxon_key'].str.upper()
+        species['taxon_key_preferred'] = \
+            species['taxon_key_preferred'].str.upper()
+        species = species.set_index('taxon_key')[['taxon_key_preferred', 'rank']]
+        # Later duplicates of a taxon key replace the earlier values
+        if not species.index.is_unique:
+            species = species.groupby(level=0, sort=False).last()
+        self.species = species
 
     # --------------------------------------------------------------------------
-    # Write results to CSV.
+    # Write results to CSV. Strings are quoted and numbers are not. Uses 
+    # pyarrow's writer if it is installed, whose default quoting matches
+    # QUOTE_NONNUMERIC.
 
     def write_file(self):
         '''
@@ -223,10 +303,16 @@ class RuleStats:
         fn = self.fn_output
         log.info('-'*50)
         log.info(f'Writing file: {fn}')
-        df = pd.DataFrame(self.species)
-        dft = df.transpose()
-        dft.index.name = 'taxon_key'
-        dft.to_csv(fn, encoding='utf-8', quoting=csv.QUOTE_NONNUMERIC)
+        if pa is None:
+            self.stats.to_csv(fn, encoding='utf-8', 
+                              quoting=csv.QUOTE_NONNUMERIC, chunksize=100000)
+            return
+
+        table = pa.Table.from_pandas(self.stats.reset_index(), 
+                                     preserve_index=False)
+        # Line endings as written by pandas
+        pacsv.write_csv(table, fn, write_options=pacsv.WriteOptions(
+            batch_size=100000, eol=os.linesep))
 
 # ------------------------------------------------------------------------------
 # Script entry point
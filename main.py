@@ -16,13 +16,6 @@ from RuleController import RuleController   # KPM
 
 # ------------------------------------------------------------------------------
 
-logging.basicConfig(level=logging.INFO, 
-            format='[%(module)s]-[%(funcName)s]-[%(levelname)s] - %(message)s', 
-            encoding = 'utf-8',
-            handlers= [
-                logging.FileHandler('./logs/debug.log', mode='w'), 
-                logging.StreamHandler()
-            ])
 log = logging.getLogger(__name__)
 
 # ------------------------------------------------------------------------------
@@ -70,6 +63,15 @@ def main(argv):
 # ------------------------------------------------------------------------------
 
 if __name__ == '__main__':
+    # Configured here rather than on import because worker processes import 
+    # this module too, which would otherwise truncate the log
+    logging.basicConfig(level=logging.INFO, 
+            format='[%(module)s]-[%(funcName)s]-[%(levelname)s] - %(message)s', 
+            encoding = 'utf-8',
+            handlers= [
+                logging.FileHandler('./logs/debug.log', mode='w'), 
+                logging.StreamHandler()
+            ])
     main(sys.argv[1:])
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,75 @@
+'''
+About  : Tests for RuleOutput.py module.
+Author : Kevin Morley
+Version: 1 (07-Jun-2023)
+'''
+
+# ------------------------------------------------------------------------------
+
+import csv
+import pytest
+import sys
+
+from types import SimpleNamespace
+
+# ------------------------------------------------------------------------------
+
+sys.path.append('./')  # path to module to be tested
+
+# ------------------------------------------------------------------------------
+
+import RuleParser
+
+from RuleOutput import RuleOutput
+
+# ------------------------------------------------------------------------------
+# Fixture to return a stand-in for a RuleParser object, holding one period rule
+# whose message spans several lines.
+
+@pytest.fixture
+def parser():
+    attrs = {attr: RuleParser.create_columns(fields) 
+             for _, attr, fields in RuleOutput.FILES}
+    periods = attrs['periods']
+    for field, value in (('taxon_key', 'nbnsys0100011441'), 
+                         ('organisation', 'Org'),
+                         ('message', 'Line one\nline two'),
+                         ('start_date', '19800101'),
+                         ('end_date', '')):
+        periods[field].append(value)
+    return SimpleNamespace(**attrs)
+
+# ------------------------------------------------------------------------------
+# Return the rows of a CSV file written by RuleOutput.
+
+def read_rows(fn):
+    with open(fn, encoding='utf-8', newline='') as file:
+        return list(csv.reader(file))
+
+# ------------------------------------------------------------------------------
+# Ensure that values spanning several lines are read back as written.
+
+def test_write_file(tmp_path):
+    output = RuleOutput(None, tmp_path)
+    rows = [['a', 'Line one\nline two', '1'], ['b', 'x\r\ny', '']]
+    output.write_file('test.csv', rows, ('key', 'message', 'value'))
+    assert read_rows(tmp_path / 'test.csv') == [['key', 'message', 'value']] + rows
+
+# ------------------------------------------------------------------------------
+# As above, for the rule files and the consolidated ruleset.
+
+def test_write(tmp_path, parser):
+    RuleOutput(parser, tmp_path).write()
+    assert read_rows(tmp_path / 'periods.csv') == [
+        ['taxon_key', 'organisation', 'message', 'start_date', 'end_date'],
+        ['nbnsys0100011441', 'Org', 'Line one\nline two', '19800101', '']]
+    rows = read_rows(tmp_path / 'all_rules.csv')
+    assert len(rows) == 2
+    assert rows[1][:5] == ['1', 'NBNSYS0100011441', 'period', 'Org', 
+                           'Line one\nline two']
+
+# ------------------------------------------------------------------------------
+
+'''
+End
+'''
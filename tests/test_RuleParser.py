@@ -0,0 +1,255 @@
+'''
+About  : Tests for RuleParser.py module.
+Author : Kevin Morley
+Version: 1 (07-Jun-2023)
+'''
+
+# ------------------------------------------------------------------------------
+
+import os
+import pytest
+import subprocess
+import sys
+
+# ------------------------------------------------------------------------------
+
+sys.path.append('./')  # path to module to be tested
+
+# ------------------------------------------------------------------------------
+
+import RuleParser
+
+# ------------------------------------------------------------------------------
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ------------------------------------------------------------------------------
+# Fixture to return the contents of an 'additional' rule file.
+
+@pytest.fixture
+def additional_file():
+    return ('; comment\n'
+            '[Metadata]\n'
+            'TestType=AncillarySpecies\n'
+            'ErrorMsg=Simple message\n'
+            '[EndMetadata]\n'
+            '[INI]\n'
+            '1=Info one\n'
+            '2=Info, two\n'
+            '[Data]\n'
+            'NBNSYS0100011077=2\n'
+            'NHMSYS0000602531=1\n')
+
+# ------------------------------------------------------------------------------
+# Fixture to return the contents of a 'seasonalperiod' rule file.
+
+@pytest.fixture
+def seasonal_file():
+    return ('[Metadata]\n'
+            'TestType=PeriodWithinYear\n'
+            'Tvk=NHMSYS0000602212\n'
+            'ErrorMsg=Check "this" record,\n'
+            '  please\n'
+            'StartDate=0401\n'
+            'EndDate=0930\n'
+            '[EndMetadata]\n'
+            '[Data]\n'
+            'Stage=Adult\n'
+            'StartDate=0101\n'
+            'EndDate=0228\n'
+            'Stage=Larva\n'
+            'StartDate=0301\n'
+            'EndDate=0428\n')
+
+# ------------------------------------------------------------------------------
+# Ensure that one value is required for each column.
+
+def test_add_rule():
+    rules = RuleParser.create_columns(RuleParser.PERIOD_FIELDS)
+    RuleParser.add_rule(rules, 'tvk', 'Org', 'Msg', '0101', '0228')
+    assert rules['end_date'] == ['0228']
+    with pytest.raises(AssertionError):
+        RuleParser.add_rule(rules, 'tvk', 'Org', 'Msg', '0101', '0228', '')
+    with pytest.raises(AssertionError):
+        RuleParser.add_rule(rules, 'tvk', 'Org', 'Msg', '0101')
+
+# ------------------------------------------------------------------------------
+# As above, for several rules, which must give columns of the same length.
+
+def test_add_rules():
+    rules = RuleParser.create_columns(RuleParser.ADDITIONAL_FIELDS)
+    RuleParser.add_rules(rules, ['a', 'b'], ['Org'] * 2, ['Msg'] * 2, 'xy')
+    assert rules['information'] == ['x', 'y']
+    with pytest.raises(AssertionError):
+        RuleParser.add_rules(rules, ['a'], ['Org'], ['Msg'])
+    rules = RuleParser.create_columns(RuleParser.ADDITIONAL_FIELDS)
+    with pytest.raises(AssertionError):
+        RuleParser.add_rules(rules, ['a', 'b'], ['Org'], ['Msg'], 'xy')
+
+# ------------------------------------------------------------------------------
+# Each [Data] key is a taxon key, whose value refers to an [INI] key. Option
+# names are lowercased.
+
+def test_parse_additional(additional_file):
+    rules, errors, skipped, abort = RuleParser.parse_additional(
+        'a.txt', additional_file.encode(), 'Org')
+    assert rules == {'taxon_key': ['nbnsys0100011077', 'nhmsys0000602531'],
+                     'organisation': ['Org', 'Org'],
+                     'message': ['Simple message', 'Simple message'],
+                     'information': ['Info, two', 'Info one']}
+    assert (errors, skipped, abort) == ([], [], False)
+
+# ------------------------------------------------------------------------------
+# If no contents are given, the rule file is read.
+
+def test_parse_additional_file(tmp_path, additional_file):
+    f = tmp_path / 'a.txt'
+    f.write_text(additional_file + '[Other]\n')
+    rules, errors, skipped, abort = RuleParser.parse_additional(
+        str(f), None, 'Org')
+    assert rules['information'] == ['Info, two', 'Info one']
+    assert (errors, skipped, abort) == ([], ['Other'], False)
+
+# ------------------------------------------------------------------------------
+# [INI] references are not case-sensitive. Missing references and [Data] keys
+# without a value give an error flag.
+
+def test_parse_additional_ini_case():
+    data = ('[Metadata]\n'
+            'TestType=AncillarySpecies\n'
+            'ErrorMsg=Msg\n'
+            '[INI]\n'
+            'Rare=Rare species\n'
+            '[Data]\n'
+            'NHMSYS0001=Rare\n'
+            'NHMSYS0002=RARE\n'
+            'NHMSYS0003=Common\n'
+            'NHMSYS0004\n')
+    rules, errors, skipped, abort = RuleParser.parse_additional(
+        'a.txt', data.encode(), 'Org')
+    assert rules['information'] == ['Rare species', 'Rare species', 
+                                    RuleParser.ERROR, RuleParser.ERROR]
+
+# ------------------------------------------------------------------------------
+# As above, for the difficulty key.
+
+def test_parse_difficulty_ini_case():
+    data = ('[Metadata]\n'
+            'TestType=IdentificationDifficulty\n'
+            '[INI]\n'
+            '2a=Difficult\n'
+            '[Data]\n'
+            'NHMSYS0001=2A\n')
+    rules, errors, skipped, abort = RuleParser.parse_difficulty(
+        'd.txt', data.encode(), 'Org')
+    assert rules['message'] == ['Difficult']
+    assert rules['difficulty_key'] == ['2A']
+    assert errors == []
+
+# ------------------------------------------------------------------------------
+# Files without [INI] are reported.
+
+def test_parse_additional_no_ini():
+    data = '[Metadata]\nTestType=AncillarySpecies\nErrorMsg=Msg\n'
+    rules, errors, skipped, abort = RuleParser.parse_additional(
+        'a.txt', data.encode(), 'Org')
+    assert rules['taxon_key'] == []
+    assert errors == ['File "a.txt" does not contain [INI]']
+
+# ------------------------------------------------------------------------------
+# A period file without [Data] gives a single rule.
+
+def test_parse_period_generic():
+    data = ('[Metadata]\n'
+            'TestType=Period\n'
+            'Tvk=NBNSYS0100011441\n'
+            'ErrorMsg=Line with ; semicolon\n'
+            'StartDate=19800101\n'
+            'EndDate=\n'
+            '[EndMetadata]\n')
+    rules, errors, skipped, abort = RuleParser.parse_period_generic(
+        'p.txt', data.encode(), 'Org', 'period')
+    assert rules == {'taxon_key': ['NBNSYS0100011441'],
+                     'organisation': ['Org'],
+                     'message': ['Line with ; semicolon'],
+                     'start_date': ['19800101'],
+                     'end_date': ['']}
+    assert (errors, skipped, abort) == ([], [], False)
+
+# ------------------------------------------------------------------------------
+# Each stage in [Data] of a seasonal period file gives a further rule. Values 
+# may continue over several lines.
+
+def test_parse_period_generic_stages(seasonal_file):
+    rules, errors, skipped, abort = RuleParser.parse_period_generic(
+        's.txt', seasonal_file.encode(), 'Org', 'PeriodWithinYear')
+    assert rules['stage'] == ['', 'Adult', 'Larva']
+    assert rules['start_date'] == ['0401', '0101', '0301']
+    assert rules['end_date'] == ['0930', '0228', '0428']
+    assert rules['message'] == ['Check "this" record,\nplease'] * 3
+    assert (errors, skipped, abort) == ([], [], False)
+
+# ------------------------------------------------------------------------------
+# Period files have no stage column, so the stages of any [Data] dates are not 
+# kept.
+
+def test_parse_period_generic_no_stage(seasonal_file):
+    data = seasonal_file.replace('PeriodWithinYear', 'Period').encode()
+    rules, errors, skipped, abort = RuleParser.parse_period_generic(
+        's.txt', data, 'Org', 'period')
+    assert list(rules) == list(RuleParser.PERIOD_FIELDS)
+    assert rules['start_date'] == ['0401', '0101', '0301']
+    assert (errors, skipped, abort) == ([], [], False)
+
+# ------------------------------------------------------------------------------
+# A file of the wrong test type stops processing of the folder.
+
+def test_parse_period_generic_test_type(seasonal_file):
+    rules, errors, skipped, abort = RuleParser.parse_period_generic(
+        's.txt', seasonal_file.encode(), 'Org', 'period')
+    assert rules['taxon_key'] == []
+    assert errors == ['Unknown TestType in file: "s.txt"']
+    assert abort
+
+# ------------------------------------------------------------------------------
+# Under the spawn start method (the default on Windows and macOS), worker
+# processes re-import the main module, and with it RuleParser. Ensure that they
+# do not truncate the skip log after the main process has written to it.
+
+SPAWN_MAIN = '''
+import logging, multiprocessing, sys
+sys.path.insert(0, {repo!r})
+from RuleParser import RuleParser
+
+if __name__ == '__main__':
+    multiprocessing.set_start_method('spawn')
+    logging.basicConfig(level=logging.INFO)
+    parser = RuleParser()
+    parser.PARALLEL_MIN_FILES = 10
+    parser.CHUNK_SIZE = 1
+    # Parsed in this process, and then in worker processes
+    parser.process_additional('Org', 'small')
+    parser.process_additional('Org', 'large')
+    parser.close()
+'''
+
+def test_skip_log_spawn(tmp_path, additional_file):
+    os.makedirs(tmp_path / 'logs')
+    files = []
+    for folder, n in (('small', 2), ('large', 20)):
+        os.makedirs(tmp_path / folder)
+        files += [os.path.join(folder, f'a{i}.txt') for i in range(n)]
+    for f in files:
+        (tmp_path / f).write_text(additional_file + '[Other]\nx=1\n')
+    (tmp_path / 'spawn_main.py').write_text(SPAWN_MAIN.format(repo=REPO))
+    subprocess.run([sys.executable, 'spawn_main.py'], cwd=tmp_path,
+                   check=True, capture_output=True)
+    with open(tmp_path / 'logs' / 'skip.log', encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert sorted(lines) == sorted(f'[Other] - {f}' for f in files)
+
+# ------------------------------------------------------------------------------
+
+'''
+End
+'''
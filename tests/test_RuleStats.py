@@ -0,0 +1,177 @@
+'''
+About  : Tests for RuleStats.py module.
+Author : Kevin Morley
+Version: 1 (07-Jun-2023)
+'''
+
+# ------------------------------------------------------------------------------
+
+import csv
+import importlib
+import os
+import pytest
+import sys
+
+# ------------------------------------------------------------------------------
+
+sys.path.append('./')  # path to module to be tested
+
+# ------------------------------------------------------------------------------
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Header of stats.csv
+STATS_FIELDS = ['taxon_key', 'taxon_key_preferred', 'rank', 'rules_total',
+                'rules_own', 'rules_preferred', 'additional', 'difficulty',
+                'flightperiod', 'period', 'range', 'region', 'seasonal']
+# Rows of all_rules.csv: id, taxon_key, ruleset, organisation, message
+RULES = (
+    (1, 'nbnsys1', 'period', 'Org', 'Message'),
+    (2, 'NBNSYS1', 'additional', 'Org', 'Line one,\nline two'),
+    (3, 'NBNSYS2', 'period', 'Org', 'Message'),
+    (4, 'NBNSYS2', 'range', 'Org', 'Message'),
+    (5, 'NBNSYS2', 'range', 'Org', 'Message'),
+    (6, 'NBNSYS3', 'seasonal', 'Org', 'Message'),
+    (7, 'NBNSYS3', 'unknown', 'Org', 'Message'),
+    (8, 'NBNSYS4', 'difficulty', 'Org', 'Message'),
+    (9, 'NBNSYS8', 'period', 'Org', 'Message'),   # orphan
+)
+# Rows of species file: taxon_key, rank, taxon_key_preferred
+SPECIES = (
+    ('NBNSYS1', 'Species', 'NBNSYS1'),
+    ('nbnsys2', 'Species', 'nbnsys1'),
+    ('NBNSYS3', 'Genus', 'NBNSYS3'),
+    ('NBNSYS4', 'Species', 'NBNSYS9'),      # unknown preferred taxon
+)
+# Rows of stats.csv for the above, as read by csv.reader
+STATS = [
+    ['NBNSYS1', 'NBNSYS1', 'Species', '5', '2', '3',
+     '1', '0', '0', '1', '0', '0', '0'],
+    ['NBNSYS2', 'NBNSYS1', 'Species', '3', '3', '0',
+     '0', '0', '0', '1', '2', '0', '0'],
+    ['NBNSYS3', 'NBNSYS3', 'Genus', '2', '2', '0',
+     '0', '0', '0', '0', '0', '0', '1'],
+    ['NBNSYS4', 'NBNSYS9', 'Species', '1', '1', '0',
+     '0', '1', '0', '0', '0', '0', '0'],
+]
+
+# ------------------------------------------------------------------------------
+# Fixture to return the RuleStats module. It writes its log to './logs' when
+# imported, so is imported within a temporary folder.
+
+@pytest.fixture(scope='module')
+def RuleStats(tmp_path_factory):
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('stats'))
+    try:
+        os.makedirs('logs')
+        sys.path.insert(0, REPO)
+        yield importlib.import_module('RuleStats')
+    finally:
+        os.chdir(cwd)
+
+# ------------------------------------------------------------------------------
+# Fixture to write the rules and species files, as written by RuleOutput and
+# the NHM species list, and return their paths.
+
+@pytest.fixture
+def files(tmp_path):
+    return write_files(tmp_path, RULES, SPECIES)
+
+# ------------------------------------------------------------------------------
+# Write rules and species files to a folder and return their paths.
+
+def write_files(folder, rules, species):
+    fn_rules = folder / 'all_rules.csv'
+    with open(fn_rules, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file, lineterminator='\r',
+                            quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow(['id', 'taxon_key', 'ruleset', 'organisation',
+                         'message'])
+        writer.writerows(rules)
+    fn_species = folder / 'species.csv'
+    with open(fn_species, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow([f'col{ix}' for ix in range(17)])
+        for taxon_key, rank, taxon_key_preferred in species:
+            row = [''] * 17
+            row[2], row[7], row[16] = taxon_key, rank, taxon_key_preferred
+            writer.writerow(row)
+    return fn_rules, fn_species
+
+# ------------------------------------------------------------------------------
+# Generate the stats and return the contents of the output file.
+
+def process(RuleStats, fn_rules, fn_species, chunksize=None):
+    fn_output = fn_rules.parent / 'stats.csv'
+    RuleStats.RuleStats(fn_species=fn_species, fn_rules=fn_rules,
+                        fn_output=fn_output, chunksize=chunksize).process()
+    with open(fn_output, 'rb') as file:
+        return file.read()
+
+# ------------------------------------------------------------------------------
+# Return the rows of the output file.
+
+def read_rows(data):
+    return list(csv.reader(data.decode('utf-8').splitlines()))
+
+# ------------------------------------------------------------------------------
+# Ensure that rules are counted for each ruleset, and that the rules of
+# non-preferred taxa are added to their preferred taxa.
+
+def test_process(RuleStats, files):
+    assert read_rows(process(RuleStats, *files)) == [STATS_FIELDS] + STATS
+
+# ------------------------------------------------------------------------------
+# Ensure that unknown rulesets, unknown preferred taxa and rules without a 
+# species are logged.
+
+def test_process_log(RuleStats, files, caplog):
+    caplog.set_level('INFO')
+    process(RuleStats, *files)
+    assert 'Unknown ruleset "unknown" for taxon key NBNSYS3' in caplog.messages
+    assert ('Unknown taxon_key_preferred (NBNSYS9) for taxon key NBNSYS4' 
+            in caplog.messages)
+    assert 'Orphaned rule for taxon key NBNSYS8' in caplog.messages
+
+# ------------------------------------------------------------------------------
+# Ensure that reading the rules in chunks gives the same output.
+
+@pytest.mark.parametrize('chunksize', [1, 2, 4, 100])
+def test_process_chunks(RuleStats, files, chunksize):
+    assert process(RuleStats, *files, chunksize) == process(RuleStats, *files)
+
+# ------------------------------------------------------------------------------
+# Ensure that the pyarrow and pandas CSV readers and writers give the same
+# output.
+
+def test_process_pandas(RuleStats, files, monkeypatch):
+    if RuleStats.pa is None:
+        pytest.skip('pyarrow not installed')
+    output = process(RuleStats, *files)
+    monkeypatch.setattr(RuleStats, 'pa', None)
+    assert process(RuleStats, *files) == output
+
+# ------------------------------------------------------------------------------
+# Ensure that files without rules or species give zero counts, whether read
+# with pyarrow or pandas, whole or in chunks.
+
+@pytest.mark.parametrize('use_pa', [True, False])
+@pytest.mark.parametrize('chunksize', [None, 2])
+def test_process_empty(RuleStats, tmp_path, monkeypatch, use_pa, chunksize):
+    if not use_pa:
+        monkeypatch.setattr(RuleStats, 'pa', None)
+    elif RuleStats.pa is None:
+        pytest.skip('pyarrow not installed')
+    files = write_files(tmp_path, (), SPECIES)
+    rows = read_rows(process(RuleStats, *files, chunksize))
+    assert rows[0] == STATS_FIELDS
+    assert [row[:3] for row in rows[1:]] == [row[:3] for row in STATS]
+    assert all(value == '0' for row in rows[1:] for value in row[3:])
+    files = write_files(tmp_path, (), ())
+    assert read_rows(process(RuleStats, *files, chunksize)) == [STATS_FIELDS]
+
+# ------------------------------------------------------------------------------
+
+'''
+End
+'''
@@ -7,9 +7,13 @@ Note   : Does not test utils.ElapsedTime class.
 
 # ------------------------------------------------------------------------------
 
+import os
 import pytest
 import sys
 
+from configparser import MissingSectionHeaderError, ParsingError
+from glob import glob
+
 # ------------------------------------------------------------------------------
 
 sys.path.append('./')  # path to module to be tested
@@ -39,6 +43,26 @@ def test_get_files(path_to_nbn_folder):
     folders = utils.get_files(path_to_nbn_folder)
     assert len(folders) == 17
 
+# ------------------------------------------------------------------------------
+# Ensure that files in nested and symlinked folders are returned as by 
+# glob('**/*.*', recursive=True), but without folders.
+
+def test_get_files_recursive(tmp_path):
+    for folder in ('a/b', 'ext.d'):
+        os.makedirs(tmp_path / folder)
+    for f in ('f.txt', '.hidden.txt', 'nodot', 'a/g.txt', 'a/b/h.txt', 
+              'ext.d/e.txt'):
+        (tmp_path / f).touch()
+    try:
+        os.symlink(tmp_path / 'ext.d', tmp_path / 'a' / 'link', 
+                   target_is_directory=True)
+    except OSError:
+        pytest.skip('Symlinks not supported')
+    files = utils.get_files_recursive(str(tmp_path))
+    assert str(tmp_path / 'a' / 'link' / 'e.txt') in files
+    assert files == [f for f in glob(str(tmp_path / '**' / '*.*'), 
+                                     recursive=True) if not os.path.isdir(f)]
+
 # ------------------------------------------------------------------------------
 # Ensure that a MultiOrderedDict object can contain multiple values for same key.
 
@@ -49,6 +73,54 @@ def test_MultiOrderedDict():
     mod['test'] = [7]
     assert len(mod['test']) == 3
 
+# ------------------------------------------------------------------------------
+# Ensure that a FastConfigParser object lowercases option names and joins the
+# values of duplicate keys.
+
+def test_FastConfigParser():
+    config = utils.FastConfigParser(allow_duplicates=True)
+    config.read_string('[Data]\nStage=Adult\nStage=Larva\n')
+    assert config['Data']['stage'] == 'Adult\nLarva'
+
+# ------------------------------------------------------------------------------
+# Ensure that indented lines continue the current value, keeping blank lines 
+# within it, and that comments are ignored.
+
+def test_FastConfigParser_continuation():
+    config = utils.FastConfigParser()
+    config.read_string('; comment\n'
+                       '[Metadata]\n'
+                       'ErrorMsg = Line one\n'
+                       '  line two\n'
+                       '\n'
+                       '  line three\n'
+                       '# comment\n'
+                       'TestType: Period\n'
+                       '\n')
+    assert config['Metadata'] == {'errormsg': 'Line one\nline two\n\nline three',
+                                  'testtype': 'Period'}
+
+# ------------------------------------------------------------------------------
+# Ensure that keys without values are allowed only if allow_no_value is True.
+
+def test_FastConfigParser_allow_no_value():
+    config = utils.FastConfigParser(allow_no_value=True)
+    config.read_string('[Data]\nNBNSYS0001\nNBNSYS0002=2\n')
+    assert config['Data'] == {'nbnsys0001': None, 'nbnsys0002': '2'}
+    config = utils.FastConfigParser()
+    with pytest.raises(ParsingError):
+        config.read_string('[Data]\nNBNSYS0001\nNBNSYS0002=2\n')
+    # Valid lines are kept
+    assert config['Data'] == {'nbnsys0002': '2'}
+
+# ------------------------------------------------------------------------------
+# Ensure that options before the first section are an error.
+
+def test_FastConfigParser_missing_section():
+    config = utils.FastConfigParser()
+    with pytest.raises(MissingSectionHeaderError):
+        config.read_string('TestType=Period\n[Metadata]\n')
+
 # ------------------------------------------------------------------------------
        
 '''
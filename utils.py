@@ -6,11 +6,14 @@ Version: 1 (24-May-2023)
 
 # ------------------------------------------------------------------------------
 
+import locale
 import logging
 import os
+import re
 import time
 
 from collections import OrderedDict
+from configparser import MissingSectionHeaderError, ParsingError
 
 # ------------------------------------------------------------------------------
 
@@ -25,16 +28,60 @@ def get_files(folder_parent):
     Return: (list)
     '''
     files = []
-    for file in os.listdir(folder_parent):
-        f = os.path.join(folder_parent, file)
-        if os.path.isfile(f):
-            files.append(f)
-        else:
-            pass
-            # log.debug(f'Skipping non-file: {f}')
+    # DirEntry caches the file type, so no extra stat call per entry
+    with os.scandir(folder_parent) as entries:
+        for entry in entries:
+            if entry.is_file():
+                files.append(entry.path)
 
     return files
 
+# --------------------------------------------------------------------------
+# Return a list of files with an extension within a parent folder and all of
+# its sub-folders, in the same order as glob('**/*.*', recursive=True). Hidden
+# files and folders are ignored. As with glob, symlinked folders are followed
+# and folders which cannot be read are ignored.
+
+def get_files_recursive(folder_parent):
+    '''
+    Params: folder_parent (string)
+    Return: (list)
+    '''
+    files = []
+    stack = [folder_parent]
+    while stack:
+        folders = []
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir():
+                        folders.append(entry.path)
+                    elif '.' in entry.name:
+                        files.append(entry.path)
+        except OSError:
+            continue
+        # Sub-folders are visited in order, depth first
+        stack.extend(reversed(folders))
+
+    return files
+
+# --------------------------------------------------------------------------
+# Return the contents of a file, read unbuffered with a single call, or None if
+# the file cannot be opened.
+
+def read_bytes(filename):
+    '''
+    Params: filename (string)
+    Return: (bytes)
+    '''
+    try:
+        with open(filename, 'rb', buffering=0) as file:
+            return file.read()
+    except OSError:
+        return None
+
 # --------------------------------------------------------------------------
 # Return a list of folders within a parent folder.
 
@@ -44,13 +91,11 @@ def get_folders(folder_parent):
     Return: (list)
     '''
     folders = []
-    for folder in os.listdir(folder_parent):
-        f = os.path.join(folder_parent, folder)
-        if os.path.isdir(f):
-            folders.append(f)
-        else:
-            pass
-            # log.debug(f'Skipping non-folder: {f}')
+    # DirEntry caches the file type, so no extra stat call per entry
+    with os.scandir(folder_parent) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                folders.append(entry.path)
 
     return folders
 
@@ -95,7 +140,7 @@ class ElapsedTime:
         self.start = time.perf_counter()
 
 # ------------------------------------------------------------------------------
-# Used by ConfigParser to allow keys with duplicate values
+# Used by FastConfigParser to allow keys with duplicate values
 
 class MultiOrderedDict(OrderedDict):
     def __setitem__(self, key, value):
@@ -104,6 +149,132 @@ class MultiOrderedDict(OrderedDict):
         else:
             super(MultiOrderedDict, self).__setitem__(key, value)
 
+# ------------------------------------------------------------------------------
+# Lightweight replacement for ConfigParser used to read the rule files. Each
+# file is parsed in a single pass into a dict of sections, each of which is a
+# dict of options. Option names are lowercased and multi-line values are joined
+# as ConfigParser does, but there is no interpolation or [DEFAULT] section.
+
+class FastConfigParser(dict):
+
+    COMMENT_PREFIXES = ('#', ';')
+    SECTION_RE = re.compile(r'\[(?P<header>.+)\]')
+
+    # --------------------------------------------------------------------------
+    # Constructor.
+
+    def __init__(self, delimiters=('=', ':'), allow_no_value=False, 
+                 allow_duplicates=False):
+        '''
+        Params: delimiters (tuple) - strings which separate keys from values
+                allow_no_value (bool) - allow keys without values if True
+                allow_duplicates (bool) - join values of duplicate keys if True
+        Return: N/A
+        '''
+        super().__init__()
+        delim = '|'.join(re.escape(d) for d in delimiters)
+        if allow_no_value:
+            self.option_re = re.compile(
+                rf'(?P<option>.*?)\s*(?:(?:{delim})\s*(?P<value>.*))?$')
+        else:
+            self.option_re = re.compile(
+                rf'(?P<option>.*?)\s*(?:{delim})\s*(?P<value>.*)$')
+        self.dict_type = MultiOrderedDict if allow_duplicates else dict
+
+    # --------------------------------------------------------------------------
+    # Read and parse a file. Files which cannot be opened are ignored. Rule 
+    # files are small, so each is read unbuffered with a single call (see 
+    # read_bytes) and decoded as a text mode open() would do.
+
+    def read(self, filename, encoding=None):
+        '''
+        Params: filename (string) - path to file
+                encoding (string) - file encoding, defaults to locale encoding
+        Return: N/A
+        '''
+        data = read_bytes(filename)
+        if data is not None:
+            self.read_data(data, filename, encoding)
+
+    # --------------------------------------------------------------------------
+    # Parse the contents of a file.
+
+    def read_data(self, data, source='<bytes>', encoding=None):
+        '''
+        Params: data (bytes) - contents of file
+                source (string) - name used in error messages
+                encoding (string) - file encoding, defaults to locale encoding
+        Return: N/A
+        '''
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        string = data.decode(encoding)
+        # Universal newlines
+        if '\r' in string:
+            string = string.replace('\r\n', '\n').replace('\r', '\n')
+        self.read_string(string, source)
+
+    # --------------------------------------------------------------------------
+    # Parse a string.
+
+    def read_string(self, string, source='<string>'):
+        '''
+        Params: string (string) - contents of file
+                source (string) - name used in error messages
+        Return: N/A
+        '''
+        cursect = None      # options of current section
+        optname = None      # name of current option
+        indent_level = 0    # indent of current option
+        error = None
+        for lineno, line in enumerate(string.split('\n'), start=1):
+            value = line.strip()
+            if not value:
+                # Blank lines are kept within multi-line values
+                if (cursect is not None and optname and 
+                    cursect[optname] is not None):
+                    cursect[optname].append('')
+                continue
+            if value.startswith(self.COMMENT_PREFIXES):
+                continue
+            # Indented lines continue the value of the current option
+            cur_indent_level = len(line) - len(line.lstrip())
+            if (cursect is not None and optname and 
+                cur_indent_level > indent_level and 
+                cursect[optname] is not None):
+                cursect[optname].append(value)
+                continue
+            
+            indent_level = cur_indent_level
+            mo = self.SECTION_RE.match(value)
+            if mo:
+                cursect = self.setdefault(mo.group('header'), self.dict_type())
+                optname = None
+            elif cursect is None:
+                raise MissingSectionHeaderError(source, lineno, line)
+            else:
+                mo = self.option_re.match(value)
+                if mo is None or not mo.group('option'):
+                    if error is None:
+                        error = ParsingError(source)
+                    error.append(lineno, line)
+                    continue
+                optname = mo.group('option').lower()
+                optval = mo.group('value')
+                if optval is not None:
+                    cursect[optname] = [optval.strip()]
+                else:
+                    cursect[optname] = None
+
+        # Join multi-line values
+        for options in self.values():
+            for name, val in options.items():
+                if isinstance(val, list):
+                    options[name] = '\n'.join(val).rstrip()
+
+        if error is not None:
+            raise error
+
 # ------------------------------------------------------------------------------
 # Test
 # ------------------------------------------------------------------------------